@@ -1,3 +1,32 @@
+# Sidan. Rum, lagring och övrig logik ligger i paketet scrumpoker/, som
+# importeras en gång per process; skriptet här körs om vid varje interaktion
+# och gör bara renderingen.
+import csv, random, time
+from html import escape
+
+import numpy as np
+import streamlit as st
+from streamlit_autorefresh import st_autorefresh
+
+from scrumpoker.analytics import estimation_analytics, pack_votes
+from scrumpoker.chat import CHAT_WINDOW, active_pings, chat_after, chat_append, set_ping
+from scrumpoker.export import EXPORT_FORMATS, export_room, pq
+from scrumpoker.fragments import shared_memo
+from scrumpoker.hub import _session_id, room_hub
+from scrumpoker.importer import backlog_batches, import_stories, iter_backlog
+from scrumpoker.metrics import metrics
+from scrumpoker.model import (
+    DEFAULT_SCALE, DEFAULT_TSHIRT, _new_story, active_story, all_have_voted,
+    clear_votes, record_vote, vote_stats,
+)
+from scrumpoker.rooms import load_rooms, room_store, update_room
+from scrumpoker.scheduler import countdown_html, schedule_timer
+from scrumpoker.session import cached_room, refresh_interval, session_player_id
+from scrumpoker.spectator import is_spectator, spectator_refresh, spectator_room, spectator_url, spectator_view
+from scrumpoker.widgets import card_grid
+
+_rerun_start = time.perf_counter()
+
 # Lista med roliga anonyma namn
 ANONYMOUS_NAMES = [
     "Anonym Älg", "Kod-Katt", "Buggsurfare", "Pixel-Panda", "Fikafantast", "Test-Tiger",
@@ -6,244 +35,40 @@ ANONYMOUS_NAMES = [
     "Epic-Ekorre", "Story-Säl", "Task-Tupp", "Retro-Ren"
 ]
 
-import time, uuid
-from html import escape
-import statistics
-import streamlit as st
-from streamlit_autorefresh import st_autorefresh
-
-# All data lagras i minnet under sessionen
-# Persist rooms in Streamlit `server_state` when available so data survives
-# reruns and is shared between clients. Fall back to a session_state key
-# when `server_state` isn't available (compatible with older Streamlit).
-try:
-    server_state = st.session_state.server_state
-except Exception:
-    # Fallback: store rooms under a reserved session_state key
-    if "_server_state_rooms" not in st.session_state:
-        st.session_state["_server_state_rooms"] = {}
-    ROOMS = st.session_state["_server_state_rooms"]
-else:
-    if "rooms" not in server_state:
-        server_state["rooms"] = {}
-    ROOMS = server_state["rooms"]
-
-DEFAULT_TSHIRT = ["XS", "S", "M", "L", "XL"]
-DEFAULT_SCALE = {"XS": 1, "S": 2, "M": 3, "L": 5, "XL": 8}
-
-def load_rooms():
-    """Returnerar alla rum från minnet."""
-    return ROOMS
-
-def save_rooms(rooms):
-    """Sparar rum till minnet (ingen disk)."""
-    global ROOMS
-    ROOMS = rooms
-
-def init_room(rooms, room_code):
-    if room_code not in rooms:
-        rooms[room_code] = {
-            "created": time.time(),
-            # Stories
-            "stories": [],  # list of {id, title, created}
-            "active_story_id": None,
-            # scale_mode: 'points' => uses 'scale' mapping; 'tshirt' => uses 'scale_labels'
-            "scale_mode": "points",
-            "scale": DEFAULT_SCALE.copy(),
-            "scale_labels": DEFAULT_TSHIRT[:],
-            # votes: story_id -> {player_name -> value}
-            "votes": {},
-            # revealed_for: story_id -> bool
-            "revealed_for": {},
-            "timer": {
-                "end": None,
-                "duration": 0,
-            },
-            "players": [],
-            # transient pings: name -> unix ts
-            "pings": {},
-            # chat: list of {name, text, ts}
-            "chat": [],
-            "last_update": time.time(),
-        }
-
-def migrate_room(room: dict) -> bool:
-    """Migrate older single-story schema to multi-story schema. Returns True if modified."""
-    changed = False
-    # If single 'story' key exists, migrate it
-    if "stories" not in room:
-        room["stories"] = []
-        changed = True
-    if "active_story_id" not in room:
-        room["active_story_id"] = None
-        changed = True
-    # Migrate old single fields
-    if "story" in room:
-        title = room.get("story") or ""
-        sid = uuid.uuid4().hex[:8]
-        room["stories"].append({"id": sid, "text": title, "created": time.time()})
-        room["active_story_id"] = sid
-        room.pop("story", None)
-        changed = True
-        # Migrate votes and revealed
-        old_votes = room.get("votes", {})
-        if isinstance(old_votes, dict) and (not old_votes or all(not isinstance(v, dict) for v in old_votes.values())):
-            room["votes"] = {sid: old_votes}
-        if "revealed" in room:
-            room["revealed_for"] = {sid: bool(room.get("revealed", False))}
-            room.pop("revealed", None)
-    # Ensure keys exist
-    room.setdefault("votes", {})
-    room.setdefault("revealed_for", {})
-    room.setdefault("players", [])
-    room.setdefault("pings", {})
-    room.setdefault("chat", [])
-    # Ensure active story exists
-    if not room["stories"]:
-        sid = uuid.uuid4().hex[:8]
-        room["stories"].append({"id": sid, "text": "", "created": time.time()})
-        room["active_story_id"] = sid
-        changed = True
-    if room["active_story_id"] not in {s["id"] for s in room["stories"]}:
-        room["active_story_id"] = room["stories"][0]["id"]
-        changed = True
-    # Ensure dicts for current story
-    sid = room["active_story_id"]
-    room["votes"].setdefault(sid, {})
-    room["revealed_for"].setdefault(sid, False)
-    # Normalize story items to have 'text' key
-    for s in room["stories"]:
-        if "text" not in s:
-            s["text"] = s.pop("title", "")
-    return changed
-
-def update_room(room_code, mutate_fn):
-    rooms = load_rooms()
-    init_room(rooms, room_code)
-    # migrate before mutation
-    if migrate_room(rooms[room_code]):
-        pass
-    mutate_fn(rooms[room_code])
-    rooms[room_code]["last_update"] = time.time()
-    if isinstance(rooms[room_code].get("players"), set):
-        rooms[room_code]["players"] = list(rooms[room_code]["players"])
-    rooms[room_code]["players"] = list(dict.fromkeys(rooms[room_code]["players"]))
-    save_rooms(rooms)
-
-def get_room(room_code):
-    rooms = load_rooms()
-    room = rooms.get(room_code)
-    if room is None:
-        return None
-    if migrate_room(room):
-        rooms[room_code] = room
-        save_rooms(rooms)
-    return room
-
-# --- UI Helpers ---
-def cached_room(room_code, last_update):
-    """Returnerar rummet utan Streamlit-cache.
-
-    OBS: Vi undviker @st.cache_data här eftersom kombinationen
-    cache + `st_autorefresh` + globalt RAM-lagrade `ROOMS` kan
-    leda till att användare ser föråldrad eller tom data.
-    Ta bort cachen så att varje rerun läser den senaste versionen
-    från den i-minnet lagrade `ROOMS`.
-    """
-    return get_room(room_code)
-
-CSS = """
-<style>
-body { overflow-x: hidden; }
-.block-container { padding-top: 1rem !important; }
-.card-grid { display: flex; flex-wrap: wrap; gap: 1.25rem; }
-.card { position: relative; width: 100px; height: 140px; perspective: 800px; cursor: pointer; }
-.card-inner { position: absolute; width: 100%; height: 100%; transition: transform 0.8s; transform-style: preserve-3d; }
-.card.flip .card-inner { transform: rotateY(180deg); }
-.card-face { position: absolute; width: 100%; height: 100%; backface-visibility: hidden; border-radius: 10px; display:flex; align-items:center; justify-content:center; font-weight:600; font-size:1.4rem; letter-spacing:1px; padding: 8px; overflow-wrap: anywhere; word-break: break-word; line-height: 1.1; text-align: center; }
-.card-front .name.long { font-size: 1.0rem; }
-.card-front { background: linear-gradient(135deg, #202431 0%, #2b2f3b 60%, #343948 100%); box-shadow:0 0 8px rgba(108,93,211,0.5); }
-.card-back { background: linear-gradient(135deg, #6C5DD3, #8E7BFF); transform: rotateY(180deg); box-shadow:0 0 12px rgba(120,80,255,0.6); }
-.card:hover .card-front { animation: rgbPulse 2s linear infinite; }
-@keyframes rgbPulse { 0% { box-shadow:0 0 8px #ff004c; } 33% { box-shadow:0 0 8px #00e1ff; } 66% { box-shadow:0 0 8px #7dff00; } 100% { box-shadow:0 0 8px #ff004c; } }
-.card.pinged .card-front { box-shadow:0 0 14px rgba(255,180,40,0.9); }
-@keyframes shake {
-    0% { transform: translateX(0) scale(1.06); }
-    20% { transform: translateX(-4px) scale(1.06); }
-    40% { transform: translateX(4px) scale(1.06); }
-    60% { transform: translateX(-3px) scale(1.06); }
-    80% { transform: translateX(3px) scale(1.06); }
-    100% { transform: translateX(0) scale(1.06); }
-}
-.card.pinged .card-inner { animation: shake 0.5s ease-in-out infinite; }
-.reveal-badge { background:#6C5DD3; padding:0.4rem 0.8rem; border-radius:6px; font-size:0.8rem; margin-left:0.5rem; }
-.consensus { color:#7dff00; font-weight:600; }
-.warning { color:#ffcc00; }
-.timer { font-size:1rem; font-weight:600; display:inline-block; padding:0.3rem 0.6rem; background:rgba(108,93,211,0.15); border-radius:6px; white-space:nowrap; }
-/* Stories UI – tabell/lista utan extra kort */
-@keyframes rgbBorder { 
-    0% { border-color: #ff004c; box-shadow: 0 0 10px rgba(255,0,76,0.5); } 
-    33% { border-color: #00e1ff; box-shadow: 0 0 10px rgba(0,225,255,0.5); } 
-    66% { border-color: #7dff00; box-shadow: 0 0 10px rgba(125,255,0,0.5); } 
-    100% { border-color: #ff004c; box-shadow: 0 0 10px rgba(255,0,76,0.5); } 
-}
-
-/* Active story badge inline in expander header using pseudo-element */
-.active-expander-marker ~ * [data-testid="stExpander"] summary::after {
-    content: "Aktiv";
-    display: inline-block;
-    margin-left: 8px;
-    padding: 2px 8px;
-    border-radius: 6px;
-    border: 1px solid #6C5DD3;
-    background: rgba(108,93,211,0.12);
-    color: #cfcff7;
-    font-size: 0.8rem;
-    line-height: 1.2;
-}
-
-/* Make expander titles wrap and show full text */
-[data-testid="stExpander"] summary {
-    white-space: normal !important;
-    overflow: visible !important;
-    text-overflow: unset !important;
-    word-break: break-word;
-}
-
-/* Sidebar chat styles */
-.sidebar-chat-box { max-height: 260px; overflow-y: auto; padding-right: 6px; margin-bottom: 8px; }
-.chat-msg { margin: 8px 0; }
-.chat-name { font-size: 0.75rem; color: #9aa0b3; margin-bottom: 2px; }
-.chat-row { display: block; }
-.chat-row.right { text-align: right; }
-.chat-bubble { display: inline-block; padding: 8px 10px; border-radius: 12px; background: #2b2f3b; color: #e6e8f0; box-shadow: 0 0 6px rgba(0,0,0,0.2); max-width: 100%; word-wrap: break-word; }
-.chat-bubble.mine { background: #6C5DD3; color: #ffffff; }
-
-/* Active select button RGB glow */
-
-
-.story-arrow {
-    display:none;
-    position:absolute;
-    left:-20px;
-    top:50%;
-    transform:translateY(-50%);
-    font-size:1.2rem;
-    color:#6C5DD3;
-    animation:arrowGlow 2s ease-in-out infinite alternate;
-}
-.story-row.active-story .story-arrow {
-    display:block;
-}
-@keyframes arrowGlow {
-    0% { text-shadow:0 0 5px #6C5DD3, 0 0 10px #6C5DD3; }
-    100% { text-shadow:0 0 10px #6C5DD3, 0 0 20px #6C5DD3, 0 0 30px #6C5DD3; }
-}
-</style>
-"""
-
-st.set_page_config(page_title="Scrum Poker", page_icon="🃏", layout="wide")
-st.markdown(CSS, unsafe_allow_html=True)
+# Delade resurser (st.cache_resource), samma objekt i alla sessioner
+_STORE = room_store()
+_HUB = room_hub()
+_METRICS = metrics()
+
+SPECTATOR = is_spectator()
+st.set_page_config(page_title="Scrum Poker", page_icon="🃏", layout="wide",
+                   initial_sidebar_state="collapsed" if SPECTATOR else "auto")
+# Stilarna ligger i static/scrumpoker.css; länken är liten och filen cachas av webbläsaren
+st.markdown('<link rel="stylesheet" href="app/static/scrumpoker.css">', unsafe_allow_html=True)
+
+# --- Åskådarläge (?view=spectator&room=KOD) ---
+# Registrerar ingen spelare och skriver aldrig; alla åskådare i rummet delar
+# samma förrenderade vy, som byggs om bara när rummets version ändras.
+if SPECTATOR:
+    room_code = spectator_room()
+    _HUB.subscribe(room_code, _session_id())
+    view = spectator_view(room_code)
+    if view is None:
+        st.info(f"Rummet {room_code} finns inte ännu.")
+    else:
+        st.markdown(view["html"], unsafe_allow_html=True)
+        if view["timer_end"]:
+            if view["timer_end"] > time.time():
+                st.markdown(f"<span class='timer'>⏱️ {countdown_html(view['timer_end'])}s</span>", unsafe_allow_html=True)
+            else:
+                st.markdown("<span class='timer'>⏱️ Tid slut!</span>", unsafe_allow_html=True)
+        if view["cards"]:
+            card_grid(cards=view["cards"], readonly=True, key="card_grid", default=None)
+    st_autorefresh(interval=spectator_refresh(), key="room_refresh")
+    _METRICS.inc("spectator_reruns", room_code)
+    if _METRICS.enabled:
+        _METRICS.observe("rerun", time.perf_counter() - _rerun_start)
+    st.stop()
 
 if st.session_state.get("play_state", "idle") == "idle":
     st.title("Scrum Poker")
@@ -266,31 +91,6 @@ def _end_play():
     st.session_state["play_state"] = "idle"
     st.session_state["play_countdown_end"] = None
 
-def _all_have_voted(room):
-    sid = room.get("active_story_id")
-    votes = room.get("votes", {}).get(sid, {})
-    players = [p for p in (room.get("players") or []) if p]
-    return len(players) > 0 and len(votes) == len(players)
-
-# Extra CSS for play overlays
-st.markdown(
-    """
-    <style>
-    .play-overlay { position:fixed; top:0; left:0; right:0; bottom:0; backdrop-filter: blur(6px); background:rgba(20,22,28,0.50); z-index:999; display:flex; align-items:center; justify-content:center; flex-direction:column; }
-    .play-count { font-size:4rem; color:#fff; text-shadow:0 0 16px #6C5DD3; margin-bottom:1rem; }
-    .play-info { font-size:1.2rem; color:#cfcff7; }
-    .play-focused { max-width:1100px; margin:0 auto; }
-    .play-focused .block-container { padding-top:0 !important; }
-    .play-exit-btn { position:fixed; top:12px; right:18px; z-index:1000; }
-    .play-wait-overlay { position:fixed; top:0; left:0; right:0; bottom:0; backdrop-filter: blur(5px); background:rgba(20,22,28,0.55); z-index:998; display:flex; align-items:center; justify-content:center; flex-direction:column; }
-    .play-wait-overlay .msg { font-size:1.4rem; color:#e6e8f0; text-shadow:0 0 10px #6C5DD3; }
-    .play-story-box { background: linear-gradient(135deg, rgba(44,47,57,0.95), rgba(36,38,46,0.95)); border-radius:12px; padding:28px 26px; box-shadow: 0 8px 30px rgba(0,0,0,0.45); color:#fff; max-width:900px; text-align:left; }
-    .play-story-box h1 { margin:0 0 8px 0; font-size:2.2rem; letter-spacing:0.6px; }
-    .play-story-box p { margin:0; font-size:1.15rem; color:#e6e8f0; line-height:1.45; }
-    </style>
-    """,
-    unsafe_allow_html=True,
-)
 
 # Lightweight global sync so all clients see latest stories without manual refresh
 # Pause global refresh while user is actively typing in any story (`story_text_*`),
@@ -301,22 +101,22 @@ def _editing_in_progress():
             return True
     return False
 
-# Enable global room sync autorefresh except during the short play countdown
-if st.session_state.get("play_state", "idle") != "countdown":
-    st_autorefresh(interval=4000, key="room_sync_refresh")
-
 # --- Sidebar setup ---
 st.sidebar.header("Inställningar")
 room_code = st.sidebar.text_input("Rumskod", value=st.session_state.get("room_code", "TEAM1"))
 if room_code != st.session_state.get("room_code"):
     st.session_state["room_code"] = room_code
+_HUB.subscribe(room_code, _session_id())
+st.sidebar.markdown(f"[📺 Storbild (åskådare)]({spectator_url(room_code)})", help="Öppna rummet skrivskyddat, t.ex. på en projektor.")
 
 
-
-# Tilldela alltid anonymt namn direkt vid start om inget finns
+# Stabilt id (följer med i adressen vid omladdning); namnet är bara för visning
+player_id = session_player_id()
+# Tilldela alltid ett namn direkt vid start om inget finns: det registrerade
+# efter en omladdning, annars ett anonymt
 if "player_name" not in st.session_state or not st.session_state["player_name"]:
-    import random
-    st.session_state["player_name"] = random.choice(ANONYMOUS_NAMES)
+    known = ((cached_room(room_code) or {}).get("players") or {}).get(player_id)
+    st.session_state["player_name"] = known or random.choice(ANONYMOUS_NAMES)
 
 _prev_name = st.session_state.get("player_name", "")
 player_name_input = st.sidebar.text_input(
@@ -331,25 +131,11 @@ if player_name != _prev_name:
     st.session_state["player_name"] = player_name
 
     def apply_rename(r):
-        # ta bort tomma namn ur players-listan
-        r["players"] = [n for n in r.get("players", []) if n]
-
-        # byt namn i players-listan
-        if _prev_name and _prev_name in r["players"]:
-            r["players"] = [player_name if n == _prev_name else n for n in r["players"]]
-
-        # lägg till nytt namn om det inte redan finns och inte är tomt
-        if player_name and player_name not in r["players"]:
-            r["players"].append(player_name)
-
-        # flytta röster från gammalt namn till nytt
-        if _prev_name and player_name:
-            for sid, pv in r.get("votes", {}).items():
-                if _prev_name in pv and player_name not in pv:
-                    pv[player_name] = pv.pop(_prev_name)
-                elif _prev_name in pv:
-                    # om nya namnet redan hade en röst, ta bort den gamla för att undvika dubblett
-                    pv.pop(_prev_name, None)
+        # röster följer id:t, så ett namnbyte är en enda ändring i registret
+        if player_name:
+            r["players"][player_id] = player_name
+        else:
+            r["players"].pop(player_id, None)
 
     update_room(room_code, apply_rename)
 
@@ -361,10 +147,10 @@ with st.sidebar.expander("Play-inställningar", expanded=False):
     st.slider("Nedräkning (sekunder)", min_value=1, max_value=10, value=st.session_state.get("play_countdown_duration", 3), key="play_countdown_duration")
 
 # --- Room bootstrap ---
-room = get_room(room_code)
+room = cached_room(room_code)
 if not room:
     update_room(room_code, lambda r: r)
-    room = get_room(room_code)
+    room = cached_room(room_code)
 
 # Enkel ändringsindikator i session_state för att trigga omritning vid behov
 st.session_state.setdefault("_room_version", 0)
@@ -375,8 +161,11 @@ scale_section = st.sidebar.expander("Skala")
 with scale_section:
     current_mode = room.get("scale_mode", "points")
     default_label = "T-shirt" if current_mode == "tshirt" else "Poäng"
-    if "scale_mode_radio" not in st.session_state:
+    # Följ rummets skala när någon annan byter den, så att en omkörning
+    # inte skriver tillbaka sessionens gamla val.
+    if "scale_mode_radio" not in st.session_state or st.session_state.get("_scale_mode_seen") != current_mode:
         st.session_state["scale_mode_radio"] = default_label
+        st.session_state["_scale_mode_seen"] = current_mode
 
     st.radio("Välj skala", ["T-shirt", "Poäng"], key="scale_mode_radio", horizontal=True)
     selected_label = st.session_state["scale_mode_radio"]
@@ -384,11 +173,12 @@ with scale_section:
 
     if selected_mode != current_mode:
         update_room(room_code, lambda r, m=selected_mode: r.update(scale_mode=m))
-        room = get_room(room_code)
+        room = cached_room(room_code)
         if not room:
             update_room(room_code, lambda r: r)
-            room = get_room(room_code)
+            room = cached_room(room_code)
         current_mode = room.get("scale_mode", selected_mode)
+        st.session_state["_scale_mode_seen"] = current_mode
 
     if selected_mode == "tshirt":
         labels = room.get("scale_labels") or DEFAULT_TSHIRT[:]
@@ -405,7 +195,7 @@ with scale_section:
                 new_labels.append(f"E{i+2}")
             if col_save.button("Spara etiketter") and new_labels:
                 update_room(room_code, lambda r: r.update(scale_labels=new_labels))
-                room = get_room(room_code)
+                room = cached_room(room_code)
     else:
         # Custom points builder with dynamic components
         st.caption("Bygg eget poängsystem. Lägg till valfria kort.")
@@ -436,7 +226,7 @@ with scale_section:
             new_scale = {str(it["label"]): float(it["value"]) for it in cp if str(it["label"]).strip() != ""}
             if new_scale:
                 update_room(room_code, lambda r: r.update(scale=new_scale))
-                room = get_room(room_code)
+                room = cached_room(room_code)
 
 
 
@@ -447,8 +237,10 @@ with st.sidebar.expander("Timer"):
     if col_t1.button("Starta timer"):
         end_time = time.time() + duration
         update_room(room_code, lambda r: r.update(timer={"end": end_time, "duration": duration}))
+        schedule_timer(room_code, end_time)
     if col_t2.button("Stoppa timer"):
         update_room(room_code, lambda r: r.update(timer={"end": None, "duration": 0}))
+        schedule_timer(room_code, None)
 
 # Reveal / reset controls
 with st.sidebar.expander("Omröstning"):
@@ -461,73 +253,80 @@ with st.sidebar.expander("Omröstning"):
     if col_r2.button("Reset"):
         def do_reset(r):
             sid = r.get("active_story_id")
-            r["votes"][sid] = {}
+            clear_votes(r, sid)
             r["revealed_for"][sid] = False
         update_room(room_code, do_reset)
 
+# Import av backlog (CSV/JSONL) – hela filen läggs in i en enda update_room
+with st.sidebar.expander("Importera backlog"):
+    upload = st.file_uploader("CSV eller JSONL", type=["csv", "jsonl"], key="backlog_upload")
+    st.caption("Känner igen id/external_id/key/request_id, title/summary och body/description.")
+    if upload is not None and st.button("Importera", key="backlog_import"):
+        result = {"added": 0, "dup": 0}
+        parse_stats = {}
+        upload.seek(0)
+        try:
+            # parsas utanför låset, en update_room per batch (se IMPORT_BATCH)
+            for batch in backlog_batches(iter_backlog(upload, upload.name, parse_stats)):
+                def do_import(r, batch=batch):
+                    added, dup = import_stories(r, batch)
+                    result["added"] += added
+                    result["dup"] += dup
+                update_room(room_code, do_import)
+        except (UnicodeDecodeError, csv.Error) as e:
+            st.error(
+                f"Filen kunde inte läsas efter rad {parse_stats.get('rows', 0)}: {e}."
+                f" {result['added']} stories importerades före felet."
+                " Spara filen som UTF-8 (CSV UTF-8 i Excel) och försök igen."
+            )
+        else:
+            st.success(
+                f"Importerade {result['added']} stories"
+                f" ({result['dup']} dubbletter, {parse_stats.get('skipped', 0)} rader hoppades över)."
+            )
+
+# Export – skrivs i block till en statisk fil och laddas ner som länk
+with st.sidebar.expander("Exportera"):
+    formats = [f for f in EXPORT_FORMATS if pq is not None or not f.endswith(".parquet")]
+    fmt = st.selectbox("Format", formats, format_func=EXPORT_FORMATS.get, key="export_format")
+    if st.button("Skapa export", key="export_create"):
+        url, filename = export_room(cached_room(room_code), room_code, fmt, lock=_STORE.lock)
+        st.session_state["export_link"] = (room_code, url, filename)
+    link = st.session_state.get("export_link")
+    if link and link[0] == room_code:
+        st.markdown(f'<a href="{escape(link[1])}" download="{escape(link[2])}">⬇️ {escape(link[2])}</a>', unsafe_allow_html=True)
+        st.caption("Länken gäller i en timme.")
+
 # --- Chat (sidebar, bottom) ---
-with st.sidebar.expander("Chat", expanded=st.session_state.get("chat_expanded", False)):
-    # Always live-refresh chat at a light interval
-    st_autorefresh(interval=2000, key="chat_live_refresh")
-    room = get_room(room_code)  # refresh to include any new messages
-    # Hämta om rummet direkt efter att meddelande skickats
-    if st.session_state.get("_clear_chat_input", False):
-        room = get_room(room_code)
-    # Hämta rumschat först
-    room_chat = list(room.get("chat") or [])
-    # Lokalt klient-historik (meddelanden skickade i denna session)
-    local_key = f"chat_history_{room_code}"
-    local_hist = list(st.session_state.get(local_key, []))
-    # Snapshot från senast skickade
-    snap = list(st.session_state.get("_last_sent_chat_snapshot") or [])
-
-    # Combined key per room - beständig ackumulering i session_state
-    combined_key = f"chat_combined_{room_code}"
-    combined = st.session_state.get(combined_key, [])
-
-    # Candidates: server chat, local history, snapshot
-    candidates = room_chat + local_hist + snap
-    # Sortera kandidater efter timestamp så order blir kronologisk
-    candidates_sorted = sorted(candidates, key=lambda x: float(x.get("ts") or 0))
-
-    # Bygg unik lista utan dubbletter och bevara tidigare combined där möjligt
-    seen = {(m.get("ts"), m.get("name"), m.get("text")) for m in combined}
-    new_combined = list(combined)
-    for c in candidates_sorted:
-        key = (c.get("ts"), c.get("name"), c.get("text"))
-        if key not in seen:
-            new_combined.append(c)
-            seen.add(key)
-
-    # Trim till senaste 500 för sessionen
-    if len(new_combined) > 500:
-        new_combined = new_combined[-500:]
-
-    st.session_state[combined_key] = new_combined
-    # Efter att ha ackumulerat i combined, rensa lokala temporära snapshots så
-    # de inte läggs till igen vid nästa rerun.
-    st.session_state[local_key] = []
-    if "_last_sent_chat_snapshot" in st.session_state:
-        st.session_state["_last_sent_chat_snapshot"] = None
-    msgs = new_combined[-200:]
+def _chat_mine_style(pid):
+    """Stilregel som högerställer och färgar den här sessionens meddelanden."""
+    sel = ".chat-row[data-pid=\"" + "".join(c if c.isalnum() or c in "-_" else f"\\{ord(c):x} " for c in pid) + "\"]"
+    return f"<style>{sel} {{ text-align: right; }} {sel} .chat-bubble {{ background: #6C5DD3; color: #ffffff; }}</style>"
+
+with _METRICS.span("chat"), st.sidebar.expander("Chat", expanded=st.session_state.get("chat_expanded", False)):
+    room = cached_room(room_code)  # refresh to include any new messages
     me = (st.session_state.get("player_name") or "").strip()
 
-    # Messages list
-    chat_html = ["<div class='sidebar-chat-box'>"]
-    for m in msgs:
+    def _chat_bubble(m):
         name = (m.get("name") or "Anonym").strip() or "Anonym"
         text = escape(str(m.get("text", "")))
-        mine = (me != "" and name == me)
-        align_cls = "right" if mine else "left"
-        bubble_cls = "chat-bubble mine" if mine else "chat-bubble"
-        chat_html.append(
-            f"<div class='chat-msg chat-row {align_cls}'>"
+        return (
+            f"<div class='chat-msg chat-row' data-pid='{escape(m.get('pid') or '')}'>"
             f"<div class='chat-name'>{escape(name)}</div>"
-            f"<div class='{bubble_cls}'>{text}</div>"
+            f"<div class='chat-bubble'>{text}</div>"
             f"</div>"
         )
-    chat_html.append("</div>")
-    st.markdown("\n".join(chat_html), unsafe_allow_html=True)
+
+    def _chat_html():
+        bubbles = (_chat_bubble(m) for m in chat_after(room, latest - CHAT_WINDOW))
+        return "<div class='sidebar-chat-box'>\n" + "\n".join(bubbles) + "\n</div>"
+
+    # Chattens HTML är densamma för alla i rummet och byggs en gång per nytt
+    # meddelande (delad cache); egna meddelanden markeras med en stilregel
+    # för sessionens spelar-id.
+    latest = room.get("chat_seq", 0)
+    chat_html = shared_memo(("chat", room_code), latest, _chat_html)
+    st.markdown(_chat_mine_style(player_id) + chat_html, unsafe_allow_html=True)
 
     # Clear or set input/select on next run if flagged (safe updates before widgets)
     if st.session_state.pop("_clear_chat_input", False):
@@ -560,26 +359,10 @@ with st.sidebar.expander("Chat", expanded=st.session_state.get("chat_expanded",
                 st.warning("Ange ditt namn i sidopanelen innan du chattar.")
             elif msg:
                 def append_msg(r):
-                    lst = r.setdefault("chat", [])
-                    lst.append({"name": me, "text": msg, "ts": time.time()})
-                    # Trim to last 500 msgs to keep file small
-                    if len(lst) > 500:
-                        del lst[:-500]
+                    chat_append(r, me, msg, pid=player_id)
                 update_room(room_code, append_msg)
                 # Expand chat so user sees the message
                 st.session_state["chat_expanded"] = True
-                # Fetch room immediately and save a persistent snapshot in session_state
-                _r2 = get_room(room_code)
-                st.session_state["_last_sent_chat_snapshot"] = _r2.get("chat", [])[-20:]
-                # Also append the server's last message to a per-session local chat history
-                # so we reuse the server timestamp and avoid duplicates.
-                local_key = f"chat_history_{room_code}"
-                last_msgs = _r2.get("chat", [])
-                if last_msgs:
-                    last_msg = last_msgs[-1]
-                    hist = st.session_state.setdefault(local_key, [])
-                    hist.append(last_msg)
-                    st.session_state[local_key] = hist
                 st.rerun()
 
     # Chat debug removed in production
@@ -588,12 +371,13 @@ with st.sidebar.expander("Chat", expanded=st.session_state.get("chat_expanded",
 # Ensure player registered (lägg alltid till namnet, även anonymt)
 if player_name:
     def ensure_player(r):
-        if player_name not in r["players"]:
-            r["players"].append(player_name)
-    update_room(room_code, ensure_player)
+        r["players"][player_id] = player_name
+    # skriv bara när spelaren saknas eller har annat namn; en vanlig omkörning ändrar inget
+    if room.get("players", {}).get(player_id) != player_name:
+        update_room(room_code, ensure_player)
 
 # Stories UI
-stories = room.get("stories", [])
+stories = room.get("stories")
 active_sid = room.get("active_story_id")
 
 # Control which story expander is open
@@ -604,31 +388,35 @@ if "expanded_story_id" not in st.session_state:
 if st.session_state.get("play_state", "idle") == "idle":
     if st.button("+ Ny story"):
         def add_story(r):
-            sid = uuid.uuid4().hex[:8]
-            r["stories"].append({"id": sid, "text": "", "created": time.time()})
-            r["votes"].setdefault(sid, {})
-            r["revealed_for"].setdefault(sid, False)
+            story = r["stories"].append(_new_story())
+            r.init_story(story["id"])
         update_room(room_code, add_story)
-        room = get_room(room_code)
-        stories = room.get("stories", [])
-        active_sid = room.get("active_story_id")
+        room = cached_room(room_code)
 
-# Om aktiv story är tom och det finns en icke-tom, välj en med text
-stories = room.get("stories", [])
-active_sid = room.get("active_story_id")
-active_obj = next((s for s in stories if s["id"] == active_sid), None)
+# Om aktiv story är tom och det finns en icke-tom, välj en med text.
+# Cachenyckeln (versionen) läses före datat: en samtidig ändring ger då
+# som värst nyare data under äldre nyckel, aldrig tvärtom.
+room_ver = room.get("version", 0)
+active_obj = active_story(room)
 if active_obj and not (active_obj.get("text", "").strip()):
-    non_empty = next((s for s in stories if s.get("text", "").strip()), None)
-    if non_empty and non_empty["id"] != active_sid:
-        update_room(room_code, lambda r: r.update(active_story_id=non_empty["id"]))
-        room = get_room(room_code)
-        stories = room.get("stories", [])
-        active_sid = room.get("active_story_id")
+    non_empty_id = shared_memo(
+        ("first_non_empty", room_code),
+        room_ver,
+        lambda: next((s["id"] for s in room["stories"] if s.get("text", "").strip()), None),
+    )
+    if non_empty_id and non_empty_id != active_obj["id"]:
+        update_room(room_code, lambda r: r.update(active_story_id=non_empty_id))
+        room = cached_room(room_code)
 
 # Stories display – expanderbara kort som sidomenyn
-stories = room.get("stories", [])
+room_ver = room.get("version", 0)  # före datat, se ovan
+stories = room.get("stories")
 active_sid = room.get("active_story_id")
 
+# Storylistan visas sidvis så att renderingen inte växer med backloggen
+STORY_PAGE_SIZE = 20
+STORY_FILTERS = ["Alla", "Oskattade", "Skattade"]
+
 # --- Play Mode Rendering Logic ---
 play_state = st.session_state.get("play_state")
 
@@ -641,11 +429,10 @@ if play_state == "countdown":
         st.session_state["play_countdown_end"] = None
         st.rerun()
     else:
-        st_autorefresh(interval=1000, key="play_countdown_refresh")
         st.markdown(
             f"""
             <div class='play-overlay'>
-              <div class='play-count'>{remaining}</div>
+              <div class='play-count'>{countdown_html(end_ct)}</div>
               <div class='play-info'>Startar röstning…</div>
               <div style='margin-top:1.5rem;'>
                 <button style='background:#6C5DD3;border:none;padding:10px 18px;border-radius:8px;color:#fff;font-weight:600;cursor:pointer;' onclick='window.location.reload()'>Avbryt</button>
@@ -656,8 +443,10 @@ if play_state == "countdown":
         )
 else:
     if play_state == "idle":
-        # Normal full stories list UI
-        for idx, story in enumerate(stories):
+        # Stories list UI – en sida i taget, aktiv story fäst överst
+        def _render_story(idx, story):
+            if story is None:
+                return  # borttagen av någon annan efter listningen (den är cachad per version)
             sid = story["id"]
             is_active = sid == active_sid
             raw_text = story.get("text", "")
@@ -677,11 +466,10 @@ else:
                         placeholder="Beskriv user story...",
                     )
                     if st.button("Spara", key=f"save_{sid}", use_container_width=True):
-                        def save_text(r, sid=sid, text_val=None):
-                            for obj in r["stories"]:
-                                if obj["id"] == sid:
-                                    obj["text"] = st.session_state.get(f"story_text_{sid}", text_val if text_val is not None else "")
-                                    break
+                        def save_text(r, sid=sid, text_val=text_val or ""):
+                            obj = r["stories"].get(sid)
+                            if obj is not None:
+                                obj["text"] = text_val
                         update_room(room_code, save_text)
                         st.session_state["expanded_story_id"] = None
                         st.rerun()
@@ -697,20 +485,113 @@ else:
                 with col3:
                     if st.button("✖ Ta bort", key=f"del_{sid}", use_container_width=True):
                         def delete_story(r, sid=sid):
-                            r["stories"] = [o for o in r["stories"] if o["id"] != sid]
+                            r["stories"].remove(sid)
                             r.get("votes", {}).pop(sid, None)
+                            r.get("agg", {}).pop(sid, None)
                             r.get("revealed_for", {}).pop(sid, None)
                             if r.get("active_story_id") == sid:
-                                if r["stories"]:
-                                    r["active_story_id"] = r["stories"][0]["id"]
-                                else:
-                                    new_sid = uuid.uuid4().hex[:8]
-                                    r["stories"].append({"id": new_sid, "text": "", "created": time.time()})
-                                    r["votes"].setdefault(new_sid, {})
-                                    r["revealed_for"].setdefault(new_sid, False)
-                                    r["active_story_id"] = new_sid
+                                if not r["stories"]:
+                                    r.init_story(r["stories"].append(_new_story())["id"])
+                                r["active_story_id"] = r["stories"].first()["id"]
                         update_room(room_code, delete_story)
                         st.rerun()
+                    col_up, col_down = st.columns(2)
+                    if col_up.button("↑", key=f"up_{sid}", help="Flytta upp", use_container_width=True, disabled=stories.prev_id(sid) is None):
+                        update_room(room_code, lambda r, sid=sid: r["stories"].move_up(sid))
+                        st.rerun()
+                    if col_down.button("↓", key=f"down_{sid}", help="Flytta ned", use_container_width=True, disabled=stories.next_id(sid) is None):
+                        update_room(room_code, lambda r, sid=sid: r["stories"].move_down(sid))
+                        st.rerun()
+
+        story_filter = st.radio(
+            "Visa",
+            STORY_FILTERS,
+            key="story_filter",
+            horizontal=True,
+            on_change=lambda: st.session_state.update(story_page=0),
+        )
+
+        def _story_listing():
+            """(position, id) för stories som matchar filtret, utom den aktiva,
+            samt den aktiva storyns position."""
+            revealed_for = room.get("revealed_for", {})
+            listing, active_idx = [], None
+            for idx, story in enumerate(stories):
+                sid = story["id"]
+                if sid == active_sid:
+                    active_idx = idx
+                    continue
+                estimated = bool(revealed_for.get(sid))
+                if (story_filter == "Oskattade" and estimated) or (story_filter == "Skattade" and not estimated):
+                    continue
+                listing.append((idx, sid))
+            return listing, active_idx
+
+        with _METRICS.span("stories"):
+            listing, active_idx = shared_memo(
+                ("story_listing", room_code, story_filter), room_ver, _story_listing
+            )
+            num_pages = max(1, -(-len(listing) // STORY_PAGE_SIZE))
+            page = min(st.session_state.get("story_page", 0), num_pages - 1)
+            if active_idx is not None:
+                _render_story(active_idx, stories.get(active_sid))
+            for idx, sid in listing[page * STORY_PAGE_SIZE:(page + 1) * STORY_PAGE_SIZE]:
+                _render_story(idx, stories.get(sid))
+            if num_pages > 1:
+                col_prev, col_page, col_next = st.columns([1, 2, 1])
+                col_prev.button("◀ Föregående", key="story_page_prev", disabled=page == 0,
+                                on_click=lambda p=page - 1: st.session_state.update(story_page=p))
+                col_page.caption(f"Sida {page + 1} av {num_pages} • {len(listing)} stories")
+                col_next.button("Nästa ▶", key="story_page_next", disabled=page >= num_pages - 1,
+                                on_click=lambda p=page + 1: st.session_state.update(story_page=p))
+
+        # Analys över alla avslöjade stories (beräknas bara när den visas)
+        if st.toggle("📊 Visa analys", key="show_analytics"):
+            all_rooms = st.checkbox("Alla rum", key="analytics_all_rooms")
+
+            def _analytics():
+                source = list(load_rooms().items()) if all_rooms else [(room_code, room)]
+                with _STORE.lock:  # rummen i minnet ändras av andra sessioner
+                    story, player, value, story_keys, player_names = pack_votes(source)
+                return estimation_analytics(story, player, value, len(story_keys), len(player_names)), player_names
+
+            if all_rooms:
+                analytics_slot = ("analytics", "*")
+                # lagrets ändringsräknare: till skillnad från antal rum + summan
+                # av versioner kan den inte ge samma nyckel efter en vräkning
+                analytics_key = _STORE.change_seq()
+            else:
+                analytics_slot, analytics_key = ("analytics", room_code), room_ver
+            with _METRICS.span("analytics"):
+                result, player_names = shared_memo(analytics_slot, analytics_key, _analytics)
+            if result is None:
+                st.info("Inga avslöjade röster att analysera ännu.")
+            else:
+                cols_a = st.columns(5)
+                cols_a[0].metric("Stories", result["stories"])
+                cols_a[1].metric("Röster", result["votes"])
+                cols_a[2].metric("Konsensus", f"{result['consensus_rate']:.0%}")
+                cols_a[3].metric("Medel-std", f"{result['mean_stdev']:.2f}")
+                mean_cv = result["mean_cv"]
+                cols_a[4].metric(
+                    "Medel-CV",
+                    "–" if np.isnan(mean_cv) else f"{mean_cv:.0%}",
+                    help="Variationskoefficient (std / medel) per story, i snitt",
+                )
+                labels, dist = result["distribution"]
+                st.caption("Fördelning av estimat")
+                st.bar_chart({"Antal": dict(zip((f"{x:g}" for x in labels), dist.tolist()))})
+                st.caption("Avvikelse mot gruppens median per spelare (positivt = högre än gruppen)")
+                st.dataframe(
+                    {
+                        "Spelare": player_names,
+                        "Röster": result["player_votes"].tolist(),
+                        "Avvikelse": np.round(result["player_bias"], 2).tolist(),
+                    },
+                    hide_index=True,
+                    use_container_width=True,
+                )
+
         # Play button (only when an active story exists)
         if active_sid:
             if st.button("▶ Play", key="play_start", type="primary"):
@@ -718,7 +599,7 @@ else:
                 st.rerun()
     elif play_state == "active":
         # Focused play UI
-        active_obj = next((s for s in stories if s["id"] == active_sid), None)
+        active_obj = active_story(room)
         story_text = (active_obj.get("text") if active_obj else "") or "(Ingen text)"
         # Render a prominent story box separated from other UI
         st.markdown(
@@ -737,9 +618,9 @@ else:
             _end_play()
             st.rerun()
         # If no timer: show wait hint until all voted
-        room_now = get_room(room_code)
+        room_now = cached_room(room_code)
         timer_end = room_now.get("timer", {}).get("end")
-        if not timer_end and not _all_have_voted(room_now):
+        if not timer_end and not all_have_voted(room_now):
             # Show a subtle non-blocking hint while waiting so voting UI remains interactive
             st.info("Väntar på alla röster…")
         # (Rest of UI below continues: voting interface, cards, timer handled later sections.)
@@ -749,25 +630,25 @@ st.markdown("<br>", unsafe_allow_html=True)
 st.markdown("<br>", unsafe_allow_html=True)
 st.divider()
 # Timer display
-room = get_room(room_code)  # refresh
+room = cached_room(room_code)  # refresh
 if not room:
     update_room(room_code, lambda r: r)
-    room = get_room(room_code)
+    room = cached_room(room_code)
 active_sid = room.get("active_story_id")
 end = room["timer"]["end"]
 if end:
-    remaining = int(end - time.time())
-    if remaining <= 0:
-        remaining = 0
+    # schemaläggaren avslöjar när tiden gått ut; siffrorna räknas ned i webbläsaren
+    if end > time.time():
+        schedule_timer(room_code, end)
+    else:
+        # reserv om schemat inte hann köras (t.ex. precis efter en omstart)
         if not room["revealed_for"].get(active_sid, False):
             def auto_reveal(r):
                 sid = r.get("active_story_id")
                 r["revealed_for"][sid] = True
             update_room(room_code, auto_reveal)
         st.success("Tid slut!")
-    # uppdatera bara när timer är aktiv så nedräkningen syns
-    st_autorefresh(interval=1000, key=f"timer_refresh_{room_code}")
-    st.markdown(f"<span class='timer'>⏱️ {remaining}s</span>", unsafe_allow_html=True)
+    st.markdown(f"<span class='timer'>⏱️ {countdown_html(end)}s</span>", unsafe_allow_html=True)
 
 # Voting interface
 
@@ -778,7 +659,7 @@ vote_placeholder = st.empty()
 player_vote = None
 votes_for_active = room.get("votes", {}).get(active_sid, {})
 if player_name:
-    player_vote = votes_for_active.get(player_name)
+    player_vote = votes_for_active.get(player_id)
     if scale_mode == "tshirt":
         card_cols = st.columns(len(current_labels))
         for idx, label in enumerate(current_labels):
@@ -786,11 +667,9 @@ if player_name:
                 vote_btn = st.button(label, key=f"vote_t_{label}")
                 if vote_btn:
                     def set_vote(r):
-                        sid = r.get("active_story_id")
-                        r["votes"].setdefault(sid, {})
-                        r["votes"][sid][player_name] = str(label)
+                        record_vote(r, r.get("active_story_id"), player_id, str(label))
                     update_room(room_code, set_vote)
-                    room = get_room(room_code)
+                    room = cached_room(room_code)
                     votes_for_active = room.get("votes", {}).get(active_sid, {})
     else:
         # points mode
@@ -801,11 +680,9 @@ if player_name:
                 vote_btn = st.button(label, key=f"vote_p_{label}")
                 if vote_btn:
                     def set_vote(r):
-                        sid = r.get("active_story_id")
-                        r["votes"].setdefault(sid, {})
-                        r["votes"][sid][player_name] = float(val)
+                        record_vote(r, r.get("active_story_id"), player_id, float(val))
                     update_room(room_code, set_vote)
-                    room = get_room(room_code)
+                    room = cached_room(room_code)
                     votes_for_active = room.get("votes", {}).get(active_sid, {})
 else:
     st.info("Ange namn i sidopanelen för att rösta.")
@@ -814,96 +691,78 @@ st.markdown("<br>", unsafe_allow_html=True)
 st.markdown("<br>", unsafe_allow_html=True)
 st.divider()
 
-room = get_room(room_code)
+room = cached_room(room_code)
 if not room:
     update_room(room_code, lambda r: r)
-    room = get_room(room_code)
+    room = cached_room(room_code)
+room_ver = room.get("version", 0)  # före datat, se ovan
 active_sid = room.get("active_story_id")
 all_votes = room.get("votes", {}).get(active_sid, {})
 revealed = room.get("revealed_for", {}).get(active_sid, False)
 
 
+# Spelarkorten renderas av en enda komponent (scrumpoker.widgets.card_grid)
+# oavsett antal spelare; ping kommer tillbaka som komponentens värde.
 card_container = st.container()
-with card_container:
-    players_list = sorted(room.get("players", []))
-    # Clean out expired pings (older than 3s)
-    def _clean_pings(r):
-        now = time.time()
-        r["pings"] = {k: v for k, v in (r.get("pings", {}) or {}).items() if now - float(v) < 1}
-    update_room(room_code, _clean_pings)
-    room = get_room(room_code)
-    pings = room.get("pings", {})
-
-    # Render cards in a grid with 9 columns per row
-    if players_list:
-        cols_per_row = 9
-        num_rows = (len(players_list) + cols_per_row - 1) // cols_per_row
-        for i in range(num_rows):
-            row_players = players_list[i*cols_per_row:(i+1)*cols_per_row]
-            cols = st.columns(cols_per_row)
-            for j in range(cols_per_row):
-                if j < len(row_players):
-                    p = row_players[j]
-                    has_vote = p in all_votes
-                    val = all_votes.get(p, "?")
-                    is_pinged = False
-                    try:
-                        ts = float(pings.get(p, 0))
-                        is_pinged = (time.time() - ts) < 1
-                    except Exception:
-                        is_pinged = False
-                    base_cls = "card flip" if revealed and has_vote else "card"
-                    card_classes = (base_cls + (" pinged" if is_pinged else "")).strip()
-                    display_name = escape(str(p))
-                    name_class = "name long" if len(str(p)) > 12 else "name"
-                    front_content = f"<span class='{name_class}'>{display_name}</span>"
-                    back_content = val if revealed and has_vote else "?"
-                    card_html = (
-                        f"<div class='{card_classes}'><div class='card-inner'>"
-                        f"<div class='card-face card-front'>{front_content}</div>"
-                        f"<div class='card-face card-back'>{back_content}</div>"
-                        f"</div></div>"
-                    )
-                    with cols[j]:
-                        st.markdown(card_html, unsafe_allow_html=True)
-                        if st.button("🔔", key=f"ping_{p}", help=f"Pingga {p}", use_container_width=False):
-                            def _set_ping(r, who=p):
-                                r.setdefault("pings", {})[who] = time.time()
-                            update_room(room_code, _set_ping)
-                            st.rerun()
-                else:
-                    with cols[j]:
-                        st.markdown("", unsafe_allow_html=True)
+with _METRICS.span("cards"), card_container:
+    players_list = sorted((room.get("players") or {}).items(), key=lambda kv: (kv[1], kv[0]))
+    pinged = active_pings(room)
+
+    def _build_cards():
+        cards = []
+        for pid, name in players_list:
+            has_vote = pid in all_votes
+            flip = bool(revealed and has_vote)
+            cards.append({
+                "key": pid,
+                "name": str(name),
+                "value": str(all_votes.get(pid, "?")) if flip else "?",
+                "flip": flip,
+                "pinged": pid in pinged,
+            })
+        return cards
+
+    cards = shared_memo(("cards", room_code), (room_ver, frozenset(pinged)), _build_cards)
+    if cards:
+        event = card_grid(cards=cards, key="card_grid", default=None)
+        if event and event.get("nonce") != st.session_state.get("_card_grid_nonce"):
+            st.session_state["_card_grid_nonce"] = event.get("nonce")
+            who = event.get("ping")
+            if who in room.get("players", {}):
+                update_room(room_code, lambda r: set_ping(r, who))
+                st.rerun()
 
-# Stats once revealed
+# Stats once revealed (O(1) ur röstaggregaten)
 if revealed and all_votes:
-    values = list(all_votes.values())
-    consensus = len(set(values)) == 1
-    if scale_mode == "points":
-        try:
-            num_vals = [float(v) for v in values]
-            mean_val = statistics.mean(num_vals)
-            try:
-                stdev_val = statistics.pstdev(num_vals)
-            except statistics.StatisticsError:
-                stdev_val = 0
-            cols_stats = st.columns(3)
-            cols_stats[0].metric("Medel", f"{mean_val:.2f}")
-            cols_stats[1].metric("Stdavvikelse", f"{stdev_val:.2f}")
-            cols_stats[2].metric("Röster", f"{len(values)}")
-        except Exception:
-            st.write("Kan inte beräkna statistik för dessa värden.")
-    else:
-        # Label frequency for T-shirt mode
-        from collections import Counter
-        counts = Counter([str(v) for v in values])
-        st.write("Frekvens:")
-        for lab, cnt in counts.items():
-            st.write(f"- {lab}: {cnt}")
-    if consensus:
-        st.markdown("<span class='consensus'>✅ Konsensus uppnådd!</span>", unsafe_allow_html=True)
-    else:
-        st.markdown("<span class='warning'>⚠️ Ingen konsensus ännu</span>", unsafe_allow_html=True)
+    with _METRICS.span("stats"):
+        stats = vote_stats(room, active_sid)
+        if scale_mode == "points":
+            if stats.get("error"):
+                st.write("Kan inte beräkna statistik för dessa värden.")
+            else:
+                cols_stats = st.columns(3)
+                cols_stats[0].metric("Medel", f"{stats['mean']:.2f}")
+                cols_stats[1].metric("Stdavvikelse", f"{stats['stdev']:.2f}")
+                cols_stats[2].metric("Röster", f"{stats['count']}")
+        else:
+            # Label frequency for T-shirt mode
+            st.write("Frekvens:")
+            for lab, cnt in stats["counts"].items():
+                st.write(f"- {lab}: {cnt}")
+        if stats["consensus"]:
+            st.markdown("<span class='consensus'>✅ Konsensus uppnådd!</span>", unsafe_allow_html=True)
+        else:
+            st.markdown("<span class='warning'>⚠️ Ingen konsensus ännu</span>", unsafe_allow_html=True)
+
+_active = active_story(room) or {}
+st.caption(
+    f"Rum: {room_code} • Story: {_active.get('text', '')} • Spelare: {len(room.get('players', []))}"
+    f" • Röster: {len(all_votes)} • ~{_STORE.room_bytes(room_code) / 1024:.1f} kB"
+)
+
+# Schemalagd omkörning (se refresh_interval)
+st_autorefresh(interval=refresh_interval(room), key="room_refresh")
 
-_tm = {s["id"]: s.get("text", "") for s in room.get("stories", [])}
-st.caption(f"Rum: {room_code} • Story: {_tm.get(active_sid, '')} • Spelare: {len(room.get('players', []))} • Röster: {len(all_votes)}")
+_METRICS.inc("reruns", room_code)
+if _METRICS.enabled:
+    _METRICS.observe("rerun", time.perf_counter() - _rerun_start)
@@ -0,0 +1,108 @@
+"""Röstskur mot rumsskrivaren (RoomWriter) utan Streamlit-sessioner.
+
+T trådar släpps samtidigt (som när alla röstar direkt efter "Play") och
+lägger V röster var i samma rum, antingen via skrivarens kö eller direkt
+med en store.mutate per röst. Skriver ut genomströmning, antal commits och
+kontrollerar att ingen röst gått förlorad (röster, agg.n och version).
+
+    python bench/burst.py --threads 30 --votes 50
+    python bench/burst.py --store sqlite --no-queue
+"""
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def run(threads, votes, store_kind="json", queue=True):
+    from scrumpoker.migrations import prepare_room
+    from scrumpoker.model import record_vote
+    from scrumpoker.rooms import _apply_mutation, new_room
+    from scrumpoker.sqlite_store import SqliteRoomStore
+    from scrumpoker.store import RoomStore
+    from scrumpoker.writer import RoomWriter
+
+    state_dir = tempfile.mkdtemp(prefix="scrumpoker-burst-")
+    if store_kind == "sqlite":
+        store = SqliteRoomStore(os.path.join(state_dir, "rooms_state.db"), prepare=prepare_room)
+    else:
+        store = RoomStore(os.path.join(state_dir, "rooms_state.json"),
+                          os.path.join(state_dir, "rooms_state.journal.jsonl"), prepare=prepare_room)
+    commits = []
+    writer = RoomWriter(store, _apply_mutation, new_room, on_commit=lambda code, n: commits.append(n))
+    writer.submit("BURST", lambda r: r)
+    commits.clear()
+    sid = store.get("BURST")["active_story_id"]
+    version0 = store.get("BURST")["version"]
+
+    def submit_direct(code, fn):
+        room = store.mutate(code, lambda r: _apply_mutation(r, fn), new_room)
+        commits.append(1)
+        return room["version"]
+
+    submit = writer.submit if queue else submit_direct
+    start = threading.Barrier(threads + 1)
+    returned = []
+
+    def worker(t):
+        start.wait()
+        for i in range(votes):
+            v = submit("BURST", lambda r, p=f"p{t}-{i}": record_vote(r, sid, p, 5.0))
+            returned.append(v)
+
+    pool = [threading.Thread(target=worker, args=(t,)) for t in range(threads)]
+    for th in pool:
+        th.start()
+    start.wait()
+    t0 = time.perf_counter()
+    for th in pool:
+        th.join()
+    elapsed = time.perf_counter() - t0
+
+    room = store.get("BURST")
+    expected = threads * votes
+    result = {
+        "store": store_kind,
+        "queue": queue,
+        "mutations": expected,
+        "elapsed_s": elapsed,
+        "per_second": expected / elapsed if elapsed else 0.0,
+        "commits": len(commits),
+        "max_batch": max(commits, default=0),
+        "votes": len(room["votes"][sid]),
+        "agg_n": room["agg"][sid].n,
+        "version_delta": room["version"] - version0,
+        "unique_versions": len(set(returned)),
+    }
+    store.close()
+    result["lost"] = expected - min(result["votes"], result["agg_n"], result["version_delta"], result["unique_versions"])
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=30)
+    parser.add_argument("--votes", type=int, default=50, help="röster per tråd")
+    parser.add_argument("--store", choices=("json", "sqlite"), default="json")
+    parser.add_argument("--no-queue", action="store_true", help="en store.mutate per röst (jämförelse)")
+    args = parser.parse_args(argv)
+    os.environ["SCRUMPOKER_SPILL"] = "0"
+    logging.disable(logging.WARNING)
+
+    r = run(args.threads, args.votes, args.store, not args.no_queue)
+    print(f"{r['mutations']} röster från {args.threads} trådar ({r['store']}, "
+          f"{'kö' if r['queue'] else 'direkt'}): {r['elapsed_s'] * 1000:.0f} ms, {r['per_second']:.0f}/s")
+    print(f"commits: {r['commits']} (största skur {r['max_batch']})")
+    print(f"röster {r['votes']}, agg.n {r['agg_n']}, version +{r['version_delta']}, "
+          f"unika versioner {r['unique_versions']}, förlorade {r['lost']}")
+    return 1 if r["lost"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
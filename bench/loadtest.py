@@ -0,0 +1,227 @@
+"""Lasttest för app.py utan webbläsare.
+
+Kör N sessioner (streamlit.testing AppTest) fördelade över M rum i samma
+process. Precis som på en server delar de rumslager och notis-hub. Varje
+runda gör varje session en slumpad åtgärd: rösta, chatta, pinga, avslöja
+eller bara köra om (som autorefresh). Skriver ut latens per omkörning
+(p50/p90/p99/max) per åtgärd, antal update_room per omkörning och
+minnestillväxt.
+
+    python bench/loadtest.py --sessions 20 --rooms 4 --rounds 10
+    python bench/loadtest.py --json result.json --fail-p90 500
+
+Sessionerna körs omväxlande, inte parallellt: siffrorna är serverns kostnad
+per omkörning med N aktiva sessioner, inte genomströmning. Tillståndet
+skrivs till en temporär katalog, så rooms_state.json rörs inte.
+"""
+
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+APP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+
+# Åtgärder och deras vikt per runda
+ACTIONS = {"idle": 35, "vote": 35, "chat": 15, "ping": 10, "reveal": 5}
+
+
+def _rss_bytes():
+    """Processens RSS (Linux), 0 om okänt."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return 0
+
+
+def _percentile(sorted_ms, q):
+    if not sorted_ms:
+        return 0.0
+    i = min(len(sorted_ms) - 1, max(0, round(q / 100 * (len(sorted_ms) - 1))))
+    return sorted_ms[i]
+
+
+class Session:
+    """En simulerad deltagare: en AppTest med rumskod och namn satta."""
+
+    def __init__(self, index, room_code, timings, errors):
+        from streamlit.testing.v1 import AppTest
+
+        self.index = index
+        self.room_code = room_code
+        self.timings = timings
+        self.errors = errors
+        self.nonce = 0
+        self.at = AppTest.from_file(APP, default_timeout=60)
+        self._run("join")
+        self.at.sidebar.text_input[0].set_value(room_code)
+        self._run("join")
+        self.at.sidebar.text_input[1].set_value(f"Spelare {index}")
+        self._run("join")
+        self.player_id = self.at.session_state["player_id"]
+
+    def _run(self, action, widget=None):
+        t0 = time.perf_counter()
+        (widget or self.at).run()
+        self.timings.setdefault(action, []).append((time.perf_counter() - t0) * 1000)
+        if self.at.exception:
+            self.errors.append(f"{action}: {self.at.exception[0].message}")
+
+    def _button(self, pred):
+        return [b for b in self.at.button if pred(b)]
+
+    def room(self):
+        snap = self.at.session_state["_room_snapshot"] if "_room_snapshot" in self.at.session_state else None
+        return snap[2] if snap else None
+
+    def act(self, action, rng, peers):
+        if action == "vote":
+            buttons = self._button(lambda b: (b.key or "").startswith(("vote_p_", "vote_t_")))
+            if buttons:
+                return self._run(action, rng.choice(buttons).click())
+        elif action == "chat":
+            self.at.text_input(key="chat_input").set_value(f"hej {rng.randrange(1000)}")
+            buttons = self._button(lambda b: b.label == "Skicka")
+            if buttons:
+                return self._run(action, buttons[0].click())
+        elif action == "ping" and peers:
+            # kortets ping-knapp skickar {ping, nonce} som komponentvärde
+            self.nonce += 1
+            self.at.session_state["card_grid"] = {"ping": rng.choice(peers), "nonce": f"{self.index}-{self.nonce}"}
+            return self._run(action)
+        elif action == "reveal":
+            buttons = self._button(lambda b: b.label == ("Reset" if rng.random() < 0.5 else "Reveal"))
+            if buttons:
+                return self._run(action, buttons[0].click())
+        self._run("idle")
+
+
+def run(sessions, rooms, rounds, seed=0, trace=False):
+    rng = random.Random(seed)
+    timings, errors = {}, []
+    rss0 = _rss_bytes()
+    if trace:
+        tracemalloc.start()
+
+    # första sessionen importerar streamlit och appen; räknas inte som tillväxt
+    t0 = time.perf_counter()
+    pool = [Session(0, "LOAD0", timings, errors)]
+    heap0 = tracemalloc.get_traced_memory()[0] if trace else 0
+    rss1 = _rss_bytes()
+    pool += [Session(i, f"LOAD{i % rooms}", timings, errors) for i in range(1, sessions)]
+    heap_join = tracemalloc.get_traced_memory()[0] if trace else 0
+    rss_join = _rss_bytes()
+
+    by_room = {}
+    for s in pool:
+        by_room.setdefault(s.room_code, []).append(s.player_id)
+    names, weights = list(ACTIONS), list(ACTIONS.values())
+    for _ in range(rounds):
+        for s in rng.sample(pool, len(pool)):
+            peers = [p for p in by_room[s.room_code] if p != s.player_id]
+            s.act(rng.choices(names, weights)[0], rng, peers)
+    elapsed = time.perf_counter() - t0
+
+    heap_end = tracemalloc.get_traced_memory()[0] if trace else 0
+    if trace:
+        tracemalloc.stop()
+    rss_end = _rss_bytes()
+
+    # update_room ökar rummets version med exakt 1, så summan av versionerna
+    # i de nyskapade rummen är antalet update_room-anrop
+    versions = {}
+    for s in pool:
+        room = s.room()
+        if room is not None:
+            versions[s.room_code] = room.get("version", 0)
+    reruns = sum(len(v) for v in timings.values())
+    all_ms = sorted(ms for v in timings.values() for ms in v)
+
+    def summary(ms):
+        ms = sorted(ms)
+        return {
+            "n": len(ms),
+            "p50": _percentile(ms, 50),
+            "p90": _percentile(ms, 90),
+            "p99": _percentile(ms, 99),
+            "max": ms[-1] if ms else 0.0,
+        }
+
+    return {
+        "sessions": sessions,
+        "rooms": rooms,
+        "rounds": rounds,
+        "seed": seed,
+        "elapsed_s": elapsed,
+        "reruns": reruns,
+        "latency_ms": {"all": summary(all_ms), **{a: summary(v) for a, v in sorted(timings.items())}},
+        "update_room_calls": sum(versions.values()),
+        "update_room_per_rerun": sum(versions.values()) / reruns if reruns else 0.0,
+        "memory": {
+            "rss_start_mb": rss0 / 1e6,
+            "rss_growth_join_mb": (rss_join - rss1) / 1e6,
+            "rss_growth_total_mb": (rss_end - rss1) / 1e6,
+            "rss_per_session_kb": (rss_join - rss1) / 1024 / max(1, sessions - 1),
+            **({
+                "heap_growth_join_mb": (heap_join - heap0) / 1e6,
+                "heap_growth_total_mb": (heap_end - heap0) / 1e6,
+                "heap_per_session_kb": (heap_join - heap0) / 1024 / max(1, sessions - 1),
+            } if trace else {}),
+        },
+        "errors": errors,
+    }
+
+
+def report(result):
+    print(f"{result['sessions']} sessioner i {result['rooms']} rum, {result['rounds']} rundor, "
+          f"{result['reruns']} omkörningar på {result['elapsed_s']:.1f} s")
+    print(f"{'åtgärd':<8} {'n':>6} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}  (ms)")
+    for action, s in result["latency_ms"].items():
+        print(f"{action:<8} {s['n']:>6} {s['p50']:>8.1f} {s['p90']:>8.1f} {s['p99']:>8.1f} {s['max']:>8.1f}")
+    print(f"update_room: {result['update_room_calls']} anrop, {result['update_room_per_rerun']:.2f} per omkörning")
+    for key, value in result["memory"].items():
+        print(f"{key}: {value:.1f}")
+    if result["errors"]:
+        print(f"{len(result['errors'])} fel, första: {result['errors'][0]}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--rooms", type=int, default=4)
+    parser.add_argument("--rounds", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--tracemalloc", action="store_true", help="mät Python-heapen (gör omkörningarna långsammare)")
+    parser.add_argument("--json", metavar="PATH", help="skriv resultatet som JSON")
+    parser.add_argument("--metrics", metavar="PATH", help="slå på appens mätning och skriv Prometheus-filen hit")
+    parser.add_argument("--fail-p90", type=float, metavar="MS", help="avsluta med fel om p90 över alla omkörningar är högre")
+    args = parser.parse_args(argv)
+
+    state_dir = tempfile.mkdtemp(prefix="scrumpoker-bench-")
+    os.environ["SCRUMPOKER_STATE_FILE"] = os.path.join(state_dir, "rooms_state.json")
+    os.environ["SCRUMPOKER_SPILL"] = "0"
+    if args.metrics:
+        os.environ["SCRUMPOKER_METRICS"] = os.path.abspath(args.metrics)
+    logging.disable(logging.WARNING)
+
+    result = run(args.sessions, max(1, args.rooms), args.rounds, args.seed, args.tracemalloc)
+    report(result)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+    if result["errors"]:
+        return 1
+    if args.fail_p90 is not None and result["latency_ms"]["all"]["p90"] > args.fail_p90:
+        print(f"p90 {result['latency_ms']['all']['p90']:.1f} ms > {args.fail_p90} ms")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,5 @@
+"""Scrum Poker: rum, lagring och logik bakom app.py.
+
+Modulerna importeras en gång per process; delade objekt (lager, hub,
+mätning) skapas via st.cache_resource i rooms, hub och metrics.
+"""
@@ -0,0 +1,93 @@
+"""Estimeringsanalys över avslöjade röster (NumPy)."""
+
+import math
+
+import numpy as np
+
+def _vote_number(value, scale, labels):
+    """Röstvärde som tal: poäng direkt, annars skalans värde eller etikettens ordning."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        pass
+    if value in scale:
+        return float(scale[value])
+    try:
+        return float(labels.index(value) + 1)
+    except ValueError:
+        return math.nan
+
+def pack_votes(rooms):
+    """Packar avslöjade röster från (rumskod, rum)-par i parallella arrayer.
+
+    Returnerar (story, player, value, story_keys, player_names) där story och
+    player är heltalsindex och value är float64. Stories ligger i följd, så
+    alla röster för en story är sammanhängande. Spelare räknas per id och
+    visas med sitt senaste namn.
+    """
+    story_idx, player_idx, values = [], [], []
+    story_keys, players, names = [], {}, []
+    for code, room in rooms:
+        registry = room.get("players") or {}
+        scale = room.get("scale") or {}
+        labels = list(room.get("scale_labels") or [])
+        revealed_for = room.get("revealed_for", {})
+        for sid, votes in room.get("votes", {}).items():
+            if not revealed_for.get(sid) or not votes:
+                continue
+            si = len(story_keys)
+            story_keys.append((code, sid))
+            for pid, value in votes.items():
+                pi = players.get(pid)
+                if pi is None:
+                    pi = players[pid] = len(names)
+                    names.append(registry.get(pid, "?"))
+                story_idx.append(si)
+                player_idx.append(pi)
+                values.append(_vote_number(value, scale, labels))
+    value = np.asarray(values, dtype=np.float64)
+    keep = ~np.isnan(value)
+    return (
+        np.asarray(story_idx, dtype=np.int32)[keep],
+        np.asarray(player_idx, dtype=np.int32)[keep],
+        value[keep],
+        story_keys,
+        names,
+    )
+
+def estimation_analytics(story, player, value, n_stories, n_players):
+    """Spridning, konsensus, medianavvikelse per spelare och fördelning (NumPy)."""
+    if value.size == 0:
+        return None
+    counts = np.bincount(story, minlength=n_stories)
+    has = counts > 0
+    safe = np.maximum(counts, 1)
+    mean = np.bincount(story, weights=value, minlength=n_stories) / safe
+    sq = np.bincount(story, weights=value * value, minlength=n_stories) / safe
+    std = np.sqrt(np.maximum(sq - mean * mean, 0.0))
+    # sortera på (story, värde) för min/max/median per story
+    order = np.lexsort((value, story))
+    s_story, s_value = story[order], value[order]
+    starts = np.flatnonzero(np.r_[True, s_story[1:] != s_story[:-1]])
+    ids = s_story[starts]
+    c = counts[ids]
+    lo, hi = s_value[starts], s_value[starts + c - 1]
+    median = np.full(n_stories, np.nan)
+    median[ids] = (s_value[starts + (c - 1) // 2] + s_value[starts + c // 2]) / 2
+    # avvikelse mot gruppens median per spelare
+    dev = value - median[story]
+    p_counts = np.bincount(player, minlength=n_players)
+    bias = np.bincount(player, weights=dev, minlength=n_players) / np.maximum(p_counts, 1)
+    labels, dist = np.unique(value, return_counts=True)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        cv = np.where(mean[has] != 0, std[has] / mean[has], np.nan)
+    return {
+        "stories": int(has.sum()),
+        "votes": int(value.size),
+        "consensus_rate": float(np.mean(lo == hi)),
+        "mean_stdev": float(std[has].mean()),
+        "mean_cv": float(np.nanmean(cv)) if np.isfinite(cv).any() else math.nan,
+        "player_bias": bias,
+        "player_votes": p_counts,
+        "distribution": (labels, dist),
+    }
@@ -0,0 +1,47 @@
+"""Chat (ringbuffert med sekvensnummer) och pingar på spelarkorten."""
+
+import time
+from itertools import islice
+
+CHAT_CAPACITY = 500  # meddelanden som sparas per rum
+CHAT_WINDOW = 200  # meddelanden som visas i sidopanelen
+
+def chat_append(room, name, text, pid=None):
+    """Lägger till ett meddelande med nästa sekvensnummer i rummets ringbuffert.
+    Namnet sparas som det var när meddelandet skrevs; pid avgör "mina"."""
+    seq = room.get("chat_seq", 0) + 1
+    room["chat_seq"] = seq
+    room["chat"].append({"seq": seq, "name": name, "pid": pid, "text": text, "ts": time.time()})
+    return seq
+
+def chat_after(room, cursor, limit=CHAT_WINDOW):
+    """Returnerar (högst `limit` senaste) meddelanden med seq > cursor, äldst först."""
+    chat = room.get("chat") or ()
+    n = min(room.get("chat_seq", 0) - cursor, len(chat), limit)
+    if n <= 0:
+        return []
+    return list(islice(reversed(chat), n))[::-1]
+
+PING_TTL = 1.0  # sekunder som ett kort skakar efter en ping
+
+def active_pings(room, now=None):
+    """Returnerar spelar-id:n med en ping yngre än PING_TTL.
+
+    Utgångna pingar ligger kvar tills nästa ping skrivs (se set_ping), så
+    läsningen behöver aldrig ändra rummet.
+    """
+    now = now or time.time()
+    active = set()
+    for pid, ts in (room.get("pings") or {}).items():
+        try:
+            if now - float(ts) < PING_TTL:
+                active.add(pid)
+        except (TypeError, ValueError):
+            pass
+    return active
+
+def set_ping(room, pid):
+    now = time.time()
+    pings = room.get("pings") or {}
+    room["pings"] = {k: v for k, v in pings.items() if now - float(v) < PING_TTL}
+    room["pings"][pid] = now
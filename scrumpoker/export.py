@@ -0,0 +1,190 @@
+"""Export av rummets stories, röster, statistik och chatt (CSV/JSONL/Parquet).
+
+Raderna byggs med generatorer i block om EXPORT_CHUNK stories och skrivs
+direkt till en fil under static/exports/, som Streamlit sedan serverar i
+bitar (`enableStaticServing`). Hela dokumentet finns alltså aldrig i minnet,
+och nedladdningen upptar ingen skripttråd.
+"""
+
+import contextlib
+import csv
+import io
+import json
+import os
+import shutil
+import time
+import uuid
+from datetime import datetime, timezone
+
+from .model import vote_stats
+
+EXPORT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static", "exports")
+EXPORT_URL = "app/static/exports"
+EXPORT_TTL = 3600  # sekunder som en exportfil ligger kvar
+EXPORT_CHUNK = 200  # stories per låsning av rummet
+EXPORT_FORMATS = {
+    "stories.csv": "Stories (CSV)",
+    "chat.csv": "Chatt (CSV)",
+    "room.jsonl": "Allt (JSONL)",
+    "stories.parquet": "Stories (Parquet)",
+}
+STORY_FIELDS = ("position", "story_id", "ext_id", "text", "revealed", "count", "mean", "stdev", "consensus", "votes")
+CHAT_FIELDS = ("seq", "time", "player_id", "name", "text")
+
+try:  # valfritt: kolumnformat
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+def _iso(ts):
+    try:
+        return datetime.fromtimestamp(float(ts), timezone.utc).isoformat(timespec="seconds")
+    except (TypeError, ValueError):
+        return ""
+
+def iter_story_rows(room, lock=None, chunk=EXPORT_CHUNK):
+    """Ger en dict per story (fälten i STORY_FIELDS) i storylistans ordning.
+
+    Rummet läses under `lock` ett block i taget, så andra sessioner kan
+    skriva mellan blocken. Röster tas bara med för avslöjade stories;
+    `votes` är en lista av (spelar-id, namn, värde).
+    """
+    lock = lock or contextlib.nullcontext()
+    with lock:
+        order = [s["id"] for s in room["stories"]]
+    for start in range(0, len(order), chunk):
+        rows = []
+        with lock:
+            stories = room["stories"]
+            players = room.get("players") or {}
+            revealed_for = room.get("revealed_for", {})
+            for pos, sid in enumerate(order[start:start + chunk], start + 1):
+                story = stories.get(sid)
+                if story is None:
+                    continue  # borttagen under exporten
+                revealed = bool(revealed_for.get(sid))
+                stats = vote_stats(room, sid)
+                votes = room.get("votes", {}).get(sid) or {}
+                rows.append({
+                    "position": pos,
+                    "story_id": sid,
+                    "ext_id": story.get("ext_id") or "",
+                    "text": story.get("text", ""),
+                    "revealed": revealed,
+                    "count": stats["count"],
+                    "mean": stats.get("mean") if revealed else None,
+                    "stdev": stats.get("stdev") if revealed else None,
+                    "consensus": stats["consensus"] if revealed else None,
+                    "votes": [(pid, players.get(pid, "?"), v) for pid, v in votes.items()] if revealed else [],
+                })
+        yield from rows
+
+def iter_chat_rows(room, lock=None):
+    """Ger chattens meddelanden (fälten i CHAT_FIELDS), äldst först."""
+    with lock or contextlib.nullcontext():
+        chat = list(room.get("chat") or ())  # högst CHAT_CAPACITY poster
+    for m in chat:
+        yield {
+            "seq": m.get("seq"),
+            "time": _iso(m.get("ts")),
+            "player_id": m.get("pid") or "",
+            "name": m.get("name", ""),
+            "text": m.get("text", ""),
+        }
+
+def _csv_value(value):
+    if value is None:
+        return ""
+    if isinstance(value, float):
+        return f"{value:g}"
+    if isinstance(value, list):
+        return "; ".join(f"{name}={_csv_value(v)}" for _, name, v in value)
+    return value
+
+def iter_csv(rows, fields):
+    """CSV-text i bitar (rubrik först, sedan en rad per post)."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(fields)
+    for row in rows:
+        writer.writerow([_csv_value(row[f]) for f in fields])
+        if buf.tell() >= 64 * 1024:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+def iter_jsonl(room, room_code, lock=None):
+    """En JSON-rad per story och per chattmeddelande, med "type" först."""
+    yield json.dumps({"type": "room", "room": room_code, "exported": _iso(time.time()),
+                      "scale_mode": room.get("scale_mode", "points")}, ensure_ascii=False) + "\n"
+    for row in iter_story_rows(room, lock):
+        row["votes"] = [{"player_id": pid, "name": name, "value": v} for pid, name, v in row["votes"]]
+        yield json.dumps({"type": "story", **row}, ensure_ascii=False) + "\n"
+    for row in iter_chat_rows(room, lock):
+        yield json.dumps({"type": "chat", **row}, ensure_ascii=False) + "\n"
+
+def _write_parquet(rows, path, chunk=EXPORT_CHUNK):
+    """Skriver story-raderna som Parquet, en radgrupp per block."""
+    schema = pa.schema([
+        ("position", pa.int32()), ("story_id", pa.string()), ("ext_id", pa.string()),
+        ("text", pa.string()), ("revealed", pa.bool_()), ("count", pa.int32()),
+        ("mean", pa.float64()), ("stdev", pa.float64()), ("consensus", pa.bool_()),
+        ("votes", pa.string()),
+    ])
+    with pq.ParquetWriter(path, schema) as writer:
+        batch = []
+        for row in rows:
+            row["votes"] = _csv_value(row["votes"])
+            batch.append(row)
+            if len(batch) >= chunk:
+                writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+                batch = []
+        if batch:
+            writer.write_table(pa.Table.from_pylist(batch, schema=schema))
+
+def prune_exports(now=None, ttl=EXPORT_TTL):
+    """Tar bort exporter äldre än `ttl` sekunder."""
+    now = now or time.time()
+    try:
+        entries = list(os.scandir(EXPORT_DIR))
+    except OSError:
+        return
+    for entry in entries:
+        try:
+            if now - entry.stat().st_mtime > ttl:
+                shutil.rmtree(entry.path, ignore_errors=True)
+        except OSError:
+            pass
+
+def export_room(room, room_code, fmt, lock=None):
+    """Skriver en export till static/exports/<token>/ och returnerar (url, filnamn).
+
+    Token är slumpad så att bara den som skapat exporten känner till länken.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"okänt exportformat: {fmt}")
+    if fmt.endswith(".parquet") and pq is None:
+        raise RuntimeError("Parquet kräver pyarrow")
+    prune_exports()
+    token = uuid.uuid4().hex
+    safe_code = "".join(ch if ch.isalnum() or ch in "-_" else "_" for ch in room_code) or "rum"
+    filename = f"scrumpoker-{safe_code}-{fmt}"
+    folder = os.path.join(EXPORT_DIR, token)
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, filename)
+    if fmt == "stories.parquet":
+        _write_parquet(iter_story_rows(room, lock), path)
+    else:
+        if fmt == "stories.csv":
+            chunks = iter_csv(iter_story_rows(room, lock), STORY_FIELDS)
+        elif fmt == "chat.csv":
+            chunks = iter_csv(iter_chat_rows(room, lock), CHAT_FIELDS)
+        else:
+            chunks = iter_jsonl(room, room_code, lock)
+        # utf-8-sig så att Excel läser åäö rätt i CSV
+        with open(path, "w", encoding="utf-8-sig" if fmt.endswith(".csv") else "utf-8", newline="") as f:
+            for part in chunks:
+                f.write(part)
+    return f"{EXPORT_URL}/{token}/{filename}", filename
@@ -0,0 +1,72 @@
+"""Delad cache för renderade fragment (kortdata, chatt-HTML, storylista, analys).
+
+Innehållet beror bara på rummets tillstånd, så det byggs en gång per
+ändring och återanvänds av alla sessioner i processen i stället för att
+varje session bygger sitt eget. Varje plats (`slot`, t.ex. ("chat", kod))
+håller bara sin senaste nyckel, och platserna rensas i LRU-ordning.
+"""
+
+import threading
+from collections import OrderedDict
+
+import streamlit as st
+
+from .metrics import metrics
+
+FRAGMENT_MAX_SLOTS = 512
+
+class FragmentCache:
+    """slot -> (nyckel, värde), LRU över platserna.
+
+    `slot` är en tuple (typ, rumskod, ...) och `key` det som måste stämma för
+    att värdet ska återanvändas, normalt rummets version. Samtidiga missar
+    på samma plats bygger bara en gång (lås per plats). Träffar och missar
+    räknas per typ och rum i mätningen (`fragment_<typ>_hits/misses`).
+    """
+
+    def __init__(self, max_slots=FRAGMENT_MAX_SLOTS):
+        self.max_slots = max_slots
+        self.lock = threading.Lock()
+        self._items = OrderedDict()
+        self._build_locks = {}
+
+    def _lookup(self, slot, key):
+        with self.lock:
+            hit = self._items.get(slot)
+            if hit is not None and hit[0] == key:
+                self._items.move_to_end(slot)
+                return hit
+        return None
+
+    def get(self, slot, key, build):
+        kind, room_code = slot[0], slot[1]
+        m = metrics()
+        hit = self._lookup(slot, key)
+        if hit is None:
+            with self.lock:
+                build_lock = self._build_locks.setdefault(slot, threading.Lock())
+            with build_lock:
+                hit = self._lookup(slot, key)
+                if hit is None:
+                    hit = (key, build())
+                    with self.lock:
+                        self._items[slot] = hit
+                        self._items.move_to_end(slot)
+                        while len(self._items) > self.max_slots:
+                            old, _ = self._items.popitem(last=False)
+                            self._build_locks.pop(old, None)
+                    m.inc(f"fragment_{kind}_misses", room_code)
+                    return hit[1]
+        m.inc(f"fragment_{kind}_hits", room_code)
+        return hit[1]
+
+    def __len__(self):
+        return len(self._items)
+
+@st.cache_resource
+def fragments():
+    return FragmentCache()
+
+def shared_memo(slot, key, build):
+    """Som en memo per session, men delad av alla sessioner (se FragmentCache)."""
+    return fragments().get(slot, key, build)
@@ -0,0 +1,106 @@
+"""Ändringsnotiser: väcker sessioner som tittar på ett rum som ändrats."""
+
+import logging
+import threading
+
+import streamlit as st
+from streamlit import runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+log = logging.getLogger(__name__)
+
+def _session_id():
+    ctx = get_script_run_ctx()
+    return ctx.session_id if ctx is not None else None
+
+def _rerun_hooks_present():
+    """Finns Streamlits interna anrop som hubben bygger på?
+
+    `_session_mgr` och `_get_async_objs` är inte publikt API. Saknas de (en
+    annan Streamlit-version) är hubben otillgänglig och sidan pollar i
+    stället (REFRESH_MAX_POLL).
+    """
+    try:
+        rt = runtime.get_instance()
+    except Exception:
+        return False
+    mgr = getattr(rt, "_session_mgr", None)
+    return callable(getattr(mgr, "get_active_session_info", None)) and callable(getattr(rt, "_get_async_objs", None))
+
+def _request_rerun(session_id):
+    """Ber Streamlit köra om en annan sessions skript. False om sessionen är borta."""
+    try:
+        rt = runtime.get_instance()
+        info = rt._session_mgr.get_active_session_info(session_id)
+    except Exception:
+        return False
+    if info is None:
+        return False
+    try:
+        rt._get_async_objs().eventloop.call_soon_threadsafe(info.session.request_rerun, None)
+    except Exception:
+        info.session.request_rerun(None)
+    return True
+
+class RoomHub:
+    """Väcker bara de sessioner som tittar på rummet som ändrades.
+
+    Varje körning prenumererar sin session på aktuellt rum. `publish` ber
+    Streamlit köra om prenumeranterna; en session som redan har en väntande
+    omkörning hoppas över så att en skur av ändringar ger en enda omkörning.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subs = {}  # room_code -> set(session_id)
+        self._session_room = {}  # session_id -> room_code
+        self._pending = set()
+        self._hooks = None  # None = inte kontrollerat än
+
+    @property
+    def available(self):
+        if not runtime.exists():
+            return False
+        if self._hooks is None:
+            self._hooks = _rerun_hooks_present()
+            if not self._hooks:
+                log.warning("Streamlit %s saknar de interna anrop som ändringsnotiserna behöver; "
+                            "sessionerna pollar i stället", st.__version__)
+        return self._hooks
+
+    def subscribe(self, room_code, session_id):
+        if session_id is None:
+            return
+        with self._lock:
+            self._pending.discard(session_id)
+            prev = self._session_room.get(session_id)
+            if prev == room_code:
+                return
+            if prev is not None:
+                self._subs.get(prev, set()).discard(session_id)
+            self._session_room[session_id] = room_code
+            self._subs.setdefault(room_code, set()).add(session_id)
+
+    def unsubscribe(self, session_id):
+        with self._lock:
+            room_code = self._session_room.pop(session_id, None)
+            self._pending.discard(session_id)
+            subs = self._subs.get(room_code)
+            if subs is not None:
+                subs.discard(session_id)
+                if not subs:
+                    del self._subs[room_code]
+
+    def publish(self, room_code, origin=None):
+        if not self.available:
+            return
+        with self._lock:
+            targets = [sid for sid in self._subs.get(room_code, ()) if sid != origin and sid not in self._pending]
+            self._pending.update(targets)
+        for sid in targets:
+            if not _request_rerun(sid):
+                self.unsubscribe(sid)
+
+@st.cache_resource
+def room_hub():
+    return RoomHub()
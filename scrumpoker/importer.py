@@ -0,0 +1,105 @@
+"""Import av backlog från CSV eller JSONL."""
+
+import csv
+import io
+import json
+import uuid
+
+from .model import _new_story
+
+# Kolumnnamn (CSV) eller nycklar (JSONL) som känns igen, i prioritetsordning.
+IMPORT_ID_KEYS = ("external_id", "id", "key", "request_id", "issue_key")
+IMPORT_TITLE_KEYS = ("title", "summary", "name", "story", "text")
+IMPORT_BODY_KEYS = ("body", "description", "details")
+# Rader per update_room. Filen parsas utanför lagrets lås och varje batch
+# läggs in som en egen ändring, så låset (eller SQLites skrivlås) hålls
+# bara medan en batch läggs till, inte medan hela filen läses. Priset är
+# att ett läsfel mitt i filen lämnar de tidigare batcharna importerade.
+IMPORT_BATCH = 500
+
+def _pick(row, keys):
+    for k in keys:
+        v = row.get(k)
+        if v not in (None, ""):
+            return str(v).strip()
+    return ""
+
+def iter_backlog(fileobj, filename, stats=None):
+    """Läser en CSV- eller JSONL-backlog rad för rad och ger (externt id, text).
+
+    Filen parsas inkrementellt, så hela exporten hålls aldrig som rader i
+    minnet. Lästa rader räknas i `stats["rows"]`, ogiltiga JSON-rader och
+    rader utan text i `stats["skipped"]`. Fel i filen (UnicodeDecodeError,
+    csv.Error) kastas vidare till anroparen.
+    """
+    stats = stats if stats is not None else {}
+    stats.setdefault("rows", 0)
+    stats.setdefault("skipped", 0)
+    text = io.TextIOWrapper(fileobj, encoding="utf-8-sig", newline="")
+    if filename.lower().endswith(".csv"):
+        rows = csv.DictReader(text)
+    else:
+        def _json_rows():
+            for line in text:
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError:
+                    stats["rows"] += 1
+                    stats["skipped"] += 1
+                    continue
+                if isinstance(row, dict):
+                    yield row
+                else:
+                    stats["rows"] += 1
+                    stats["skipped"] += 1
+        rows = _json_rows()
+    try:
+        for row in rows:
+            stats["rows"] += 1
+            row = {str(k or "").strip().lower(): v for k, v in row.items()}
+            title = _pick(row, IMPORT_TITLE_KEYS)
+            body = _pick(row, IMPORT_BODY_KEYS)
+            story_text = f"{title}\n\n{body}" if title and body else (title or body)
+            if not story_text:
+                stats["skipped"] += 1
+                continue
+            yield _pick(row, IMPORT_ID_KEYS) or None, story_text
+    finally:
+        text.detach()  # låt uppladdningen vara öppen
+
+def backlog_batches(rows, size=IMPORT_BATCH):
+    """Delar (externt id, text)-paren i listor om högst `size`."""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def import_stories(room, rows):
+    """Lägger till stories från (externt id, text)-par i en batch.
+
+    Rader vars externa id redan finns i rummet (eller tidigare i samma fil)
+    hoppas över. Returnerar (tillagda, dubbletter).
+    """
+    known = {s["ext_id"] for s in room["stories"] if s.get("ext_id")}
+    added = dup = 0
+    for ext_id, text in rows:
+        if ext_id:
+            if ext_id in known:
+                dup += 1
+                continue
+            known.add(ext_id)
+        story = _new_story(text)
+        while story["id"] in room["stories"]:
+            story["id"] = uuid.uuid4().hex[:8]
+        if ext_id:
+            story["ext_id"] = ext_id
+        room["stories"].append(story)
+        room.init_story(story["id"])
+        added += 1
+    return added, dup
@@ -0,0 +1,157 @@
+"""Mätning av omkörningar: histogram per spann och räknare per rum."""
+
+import atexit
+import bisect
+import contextlib
+import os
+import threading
+import time
+
+import streamlit as st
+
+# Spann runt appens större delar samlas i histogram och skrivs som en
+# Prometheus-textfil (t.ex. för node_exporters textfile-collector) när
+# SCRUMPOKER_METRICS pekar ut en fil. Avstängt är ett spann en delad
+# nullcontext och räknarna returnerar direkt.
+METRICS_FILE = os.environ.get("SCRUMPOKER_METRICS") or None
+METRICS_INTERVAL = 5.0  # sekunder mellan skrivningar av filen
+SPAN_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+# Räknarna har en etikett per rum. Fler rum än så slås ihop i rummet
+# "other" (de som räknats upp längst sedan), så att minne och antal
+# tidsserier inte växer med alla rumskoder som någonsin använts.
+METRICS_MAX_ROOMS = int(os.environ.get("SCRUMPOKER_METRICS_MAX_ROOMS", 200))
+OTHER_ROOM = "other"
+_NO_SPAN = contextlib.nullcontext()
+
+def _prom_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class _Span:
+    __slots__ = ("metrics", "name", "t0")
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe(self.name, time.perf_counter() - self.t0)
+
+class Metrics:
+    """Histogram per spann och räknare per (namn, rum) för hela processen."""
+
+    def __init__(self, path=None, interval=METRICS_INTERVAL, buckets=SPAN_BUCKETS,
+                 max_rooms=METRICS_MAX_ROOMS):
+        self.path = path
+        self.enabled = bool(path)
+        self.buckets = buckets
+        self.max_rooms = max_rooms
+        self.lock = threading.Lock()
+        self.hist = {}  # spann -> [antal per hink..., +Inf, summa sekunder]
+        self.counters = {}  # (namn, rumskod) -> värde
+        self._room_seen = {}  # rumskod -> senaste uppräkning
+        self._last_rate = (time.time(), 0)
+        if self.enabled:
+            self.interval = interval
+            threading.Thread(target=self._run, name="scrumpoker-metrics", daemon=True).start()
+            atexit.register(self.write)
+
+    def span(self, name):
+        return _Span(self, name) if self.enabled else _NO_SPAN
+
+    def observe(self, name, seconds):
+        i = bisect.bisect_left(self.buckets, seconds)
+        with self.lock:
+            h = self.hist.get(name)
+            if h is None:
+                h = self.hist[name] = [0] * (len(self.buckets) + 1) + [0.0]
+            h[i] += 1
+            h[-1] += seconds
+
+    def inc(self, name, room_code, n=1):
+        if not self.enabled:
+            return
+        key = (name, room_code)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + n
+            self._room_seen[room_code] = time.monotonic()
+            if len(self._room_seen) > 2 * self.max_rooms:
+                self._fold_rooms()  # annars vid nästa skrivning av filen
+
+    def _fold_rooms(self):
+        """Slår ihop räknarna för de minst nyligen aktiva rummen till OTHER_ROOM.
+
+        Anropas under låset. Ett rum som blir aktivt igen börjar om från noll
+        under sin egen etikett, vilket Prometheus ser som en nollställning.
+        """
+        excess = len(self._room_seen) - self.max_rooms
+        if excess <= 0:
+            return
+        ordered = sorted((c for c in self._room_seen if c != OTHER_ROOM), key=self._room_seen.get)
+        victims = set(ordered[:excess])
+        for name, code in [k for k in self.counters if k[1] in victims]:
+            other = (name, OTHER_ROOM)
+            self.counters[other] = self.counters.get(other, 0) + self.counters.pop((name, code))
+        for code in victims:
+            del self._room_seen[code]
+
+    def render(self):
+        """Alla mätvärden i Prometheus textformat."""
+        with self.lock:
+            self._fold_rooms()
+            hist = {k: list(v) for k, v in self.hist.items()}
+            counters = dict(self.counters)
+        lines = ["# TYPE scrumpoker_span_seconds histogram"]
+        for name, h in sorted(hist.items()):
+            label = _prom_label(name)
+            cum = 0
+            for le, n in zip([*map(str, self.buckets), "+Inf"], h[:-1]):
+                cum += n
+                lines.append(f'scrumpoker_span_seconds_bucket{{span="{label}",le="{le}"}} {cum}')
+            lines.append(f'scrumpoker_span_seconds_sum{{span="{label}"}} {h[-1]:.6f}')
+            lines.append(f'scrumpoker_span_seconds_count{{span="{label}"}} {cum}')
+        for metric in sorted({name for name, _ in counters}):
+            lines.append(f"# TYPE scrumpoker_{metric}_total counter")
+            for (name, code), value in sorted(counters.items()):
+                if name == metric:
+                    lines.append(f'scrumpoker_{metric}_total{{room="{_prom_label(code)}"}} {value}')
+        # träffgrad för den delade fragment-cachen, per fragmenttyp över alla rum
+        lookups = {}
+        for (name, _), value in counters.items():
+            if name.startswith("fragment_") and name.endswith(("_hits", "_misses")):
+                kind, _, outcome = name[len("fragment_"):].rpartition("_")
+                counts = lookups.setdefault(kind, [0, 0])  # [träffar, uppslag]
+                counts[0] += value if outcome == "hits" else 0
+                counts[1] += value
+        if lookups:
+            lines.append("# TYPE scrumpoker_fragment_hit_ratio gauge")
+            for kind, (hits, total) in sorted(lookups.items()):
+                lines.append(f'scrumpoker_fragment_hit_ratio{{fragment="{_prom_label(kind)}"}} {hits / total:.4f}')
+        now = time.time()
+        total = sum(v for (name, _), v in counters.items() if name == "mutations")
+        t0, total0 = self._last_rate
+        self._last_rate = (now, total)
+        lines.append("# TYPE scrumpoker_mutations_per_second gauge")
+        lines.append(f"scrumpoker_mutations_per_second {(total - total0) / max(now - t0, 1e-9):.3f}")
+        return "\n".join(lines) + "\n"
+
+    def write(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(self.render())
+        os.replace(tmp, self.path)
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.write()
+            except OSError:
+                pass
+
+@st.cache_resource
+def metrics():
+    return Metrics(METRICS_FILE)
@@ -0,0 +1,101 @@
+"""Schemamigreringar för rum lästa från disk."""
+
+import uuid
+
+from .chat import CHAT_CAPACITY
+from .metrics import metrics
+from .model import Room, _agg_build, _new_story
+
+# Varje steg körs exakt en gång per rum; rummet stämplas med den version
+# det senast migrerats till i "schema". Nya steg läggs sist i MIGRATIONS.
+
+def _migrate_multi_story(room):
+    """Äldre enkel-story-schema (story/votes/revealed) -> flera stories."""
+    room.setdefault("stories", [])
+    room.setdefault("active_story_id", None)
+    if "story" in room:
+        story = _new_story(room.pop("story") or "")
+        sid = story["id"]
+        room["stories"].append(story)
+        room["active_story_id"] = sid
+        # Migrate votes and revealed
+        old_votes = room.get("votes", {})
+        if isinstance(old_votes, dict) and (not old_votes or all(not isinstance(v, dict) for v in old_votes.values())):
+            room["votes"] = {sid: old_votes}
+        if "revealed" in room:
+            room["revealed_for"] = {sid: bool(room.pop("revealed", False))}
+
+def _migrate_defaults(room):
+    """Saknade nycklar, 'title' -> 'text' och en giltig aktiv story."""
+    room.setdefault("votes", {})
+    room.setdefault("revealed_for", {})
+    room.setdefault("players", [])
+    room.setdefault("pings", {})
+    room.setdefault("chat", [])
+    room.setdefault("version", 0)
+    for s in room["stories"]:
+        if "text" not in s:
+            s["text"] = s.pop("title", "")
+    if not room["stories"]:
+        room["stories"].append(_new_story())
+    if room["active_story_id"] not in {s["id"] for s in room["stories"]}:
+        room["active_story_id"] = room["stories"][0]["id"]
+    for s in room["stories"]:
+        room["votes"].setdefault(s["id"], {})
+        room["revealed_for"].setdefault(s["id"], False)
+
+def _migrate_chat_seq(room):
+    """Sekvensnummer på chatmeddelanden (ringbufferten i chat_append)."""
+    seq = room.get("chat_seq", 0)
+    msgs = []
+    for m in room.get("chat") or []:
+        if "seq" not in m:
+            seq += 1
+            m = {**m, "seq": seq}
+        msgs.append(m)
+    room["chat"] = msgs[-CHAT_CAPACITY:]
+    room["chat_seq"] = max(seq, msgs[-1]["seq"] if msgs else 0)
+
+def _migrate_vote_aggregates(room):
+    """Bygger röstaggregaten för befintliga röster."""
+    room["agg"] = {sid: _agg_build(votes) for sid, votes in room["votes"].items()}
+
+def _migrate_player_ids(room):
+    """Spelare som id -> namn; röster och pingar nycklas med spelar-id."""
+    ids = {}
+
+    def pid(name):
+        if name not in ids:
+            ids[name] = uuid.uuid4().hex[:12]
+        return ids[name]
+
+    room["players"] = {pid(name): name for name in room.get("players") or [] if name}
+    table = getattr(room, "new_votes", dict)  # rum som redan ligger i minnet
+    room["votes"] = {sid: table({pid(name): v for name, v in votes.items()}) for sid, votes in room["votes"].items()}
+    room["pings"] = {}  # pingar är kortlivade, inget att flytta
+
+MIGRATIONS = [
+    (1, _migrate_multi_story),
+    (2, _migrate_defaults),
+    (3, _migrate_chat_seq),
+    (4, _migrate_vote_aggregates),
+    (5, _migrate_player_ids),
+]
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def migrate_room(room: dict) -> bool:
+    """Kör de migreringssteg rummet ännu inte kört. Returns True if modified."""
+    if room.get("schema", 0) >= SCHEMA_VERSION:
+        return False
+    with metrics().span("migrate"):
+        for version, step in MIGRATIONS:
+            if room.get("schema", 0) < version:
+                step(room)
+                room["schema"] = version
+    return True
+
+def prepare_room(room: dict):
+    """Gör ett rum läst från disk redo för minnet: migrera dicten och bygg
+    ett Room av den. Returnerar (rum, migrerades)."""
+    changed = migrate_room(room)
+    return Room.from_dict(room), changed
@@ -0,0 +1,448 @@
+"""Rummodellen: stories, röster med aggregat och själva rummet.
+
+Klasserna har __slots__ men går att läsa och skriva som dictar
+(room["votes"], story.get("text")), och serialiseras via to_dict/to_list.
+"""
+
+import math
+import sys
+import time
+import uuid
+from collections import deque
+
+from .chat import CHAT_CAPACITY
+
+DEFAULT_TSHIRT = ["XS", "S", "M", "L", "XL"]
+DEFAULT_SCALE = {"XS": 1, "S": 2, "M": 3, "L": 5, "XL": 8}
+
+# --- Stories ---
+class StoryList:
+    """Ordnad samling stories med id-index.
+
+    Uppslag, borttag och flytt är O(1): storyobjekten ligger i en dict per
+    id och ordningen hålls som en dubbellänkad lista över id:n. Serialiseras
+    som en vanlig lista (`to_list`) och byggs upp igen i `Room.from_dict`.
+
+    Ändringar görs under lagrets lås, men läsare itererar utan lås. Iteration
+    tar därför först en ögonblicksbild av ordningen (utan att kasta om en
+    story tas bort eller flyttas under tiden) och går sedan över den.
+    """
+
+    __slots__ = ("_items", "_prev", "_next", "_head", "_tail")
+
+    def __init__(self, stories=()):
+        self._items = {}
+        self._prev = {}
+        self._next = {}
+        self._head = None
+        self._tail = None
+        for story in stories:
+            self.append(story)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __bool__(self):
+        return bool(self._items)
+
+    def __contains__(self, sid):
+        return sid in self._items
+
+    def _order(self):
+        # .get och längdgränsen: en samtidig flytt kan ge en tillfälligt
+        # inkonsekvent länkning, men aldrig KeyError eller en oändlig loop
+        order, nxt, limit = {}, self._next, len(self._items)
+        sid = self._head
+        while sid is not None and sid not in order and len(order) <= limit:
+            order[sid] = None
+            sid = nxt.get(sid)
+        return order
+
+    def __iter__(self):
+        items = self._items
+        for sid in self._order():
+            story = items.get(sid)
+            if story is not None:
+                yield story
+
+    def get(self, sid, default=None):
+        return self._items.get(sid, default)
+
+    def first(self):
+        head = self._head
+        return None if head is None else self._items.get(head)
+
+    def prev_id(self, sid):
+        return self._prev.get(sid)
+
+    def next_id(self, sid):
+        return self._next.get(sid)
+
+    def _link_before(self, sid, before):
+        if before is None:
+            self._prev[sid], self._next[sid] = self._tail, None
+            if self._tail is not None:
+                self._next[self._tail] = sid
+            self._tail = sid
+        else:
+            prev = self._prev[before]
+            self._prev[sid], self._next[sid] = prev, before
+            self._prev[before] = sid
+            if prev is not None:
+                self._next[prev] = sid
+        if self._prev[sid] is None:
+            self._head = sid
+
+    def _unlink(self, sid):
+        prev, nxt = self._prev.pop(sid), self._next.pop(sid)
+        if prev is None:
+            self._head = nxt
+        else:
+            self._next[prev] = nxt
+        if nxt is None:
+            self._tail = prev
+        else:
+            self._prev[nxt] = prev
+
+    def append(self, story):
+        sid = story["id"]
+        if sid in self._items:
+            self._unlink(sid)
+        self._items[sid] = story
+        self._link_before(sid, None)
+        return story
+
+    def remove(self, sid):
+        """Tar bort och returnerar storyn (None om den saknas)."""
+        story = self._items.pop(sid, None)
+        if story is not None:
+            self._unlink(sid)
+        return story
+
+    def move(self, sid, before=None):
+        """Flyttar storyn före `before` (None = sist)."""
+        if sid not in self._items or sid == before or (before is not None and before not in self._items):
+            return
+        self._unlink(sid)
+        self._link_before(sid, before)
+
+    def move_up(self, sid):
+        prev = self._prev.get(sid)
+        if prev is not None:
+            self.move(sid, before=prev)
+
+    def move_down(self, sid):
+        nxt = self._next.get(sid)
+        if nxt is not None:
+            self.move(sid, before=self._next[nxt])
+
+    def to_list(self):
+        return list(self)
+
+def active_story(room):
+    """Rummets aktiva story (O(1)), eller None."""
+    return room["stories"].get(room.get("active_story_id"))
+
+class _Slotted:
+    """Dict-kompatibel åtkomst (x["k"], get, setdefault, update, in) för
+    modellklasserna med __slots__. Nycklarna är slot-namnen; en slot som
+    inte satts räknas som saknad nyckel."""
+
+    __slots__ = ()
+    _transient = ()  # slots som inte serialiseras
+
+    def __getitem__(self, key):
+        if key in self.__slots__:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                pass
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def __contains__(self, key):
+        return key in self.__slots__ and hasattr(self, key)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default) if key in self.__slots__ else default
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def pop(self, key, *default):
+        if key not in self:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        value = getattr(self, key)
+        delattr(self, key)
+        return value
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def keys(self):
+        return [k for k in self.__slots__ if k not in self._transient and hasattr(self, k)]
+
+    def items(self):
+        return [(k, getattr(self, k)) for k in self.keys()]
+
+    def to_dict(self):
+        return dict(self.items())
+
+class Story(_Slotted):
+    """En story: id, text, created och ext_id (bara för importerade)."""
+
+    __slots__ = ("id", "text", "created", "ext_id")
+
+    def __init__(self, id, text="", created=None, ext_id=None):
+        self.id = id
+        self.text = text
+        self.created = time.time() if created is None else created
+        if ext_id:
+            self.ext_id = ext_id
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(sys.intern(d["id"]), d.get("text", ""), d.get("created"), d.get("ext_id"))
+
+def _new_story(text=""):
+    return Story(uuid.uuid4().hex[:8], text)
+
+# --- Röster ---
+# Varje story har löpande aggregat (room["agg"][story_id]) som hålls i takt
+# med room["votes"] av record_vote/clear_votes, så att
+# statistik och "alla har röstat" läses i O(1).
+
+class PlayerIndex:
+    """Spelar-id -> kolumn i rummets VoteTable:er (gemensam för alla stories)."""
+
+    __slots__ = ("slots", "ids")
+
+    def __init__(self):
+        self.slots = {}
+        self.ids = []
+
+    def slot(self, pid):
+        i = self.slots.get(pid)
+        if i is None:
+            i = self.slots[pid] = len(self.ids)
+            self.ids.append(pid)
+        return i
+
+_VOTE_VALUES = {}
+
+def _intern_vote(value):
+    """Delar lika röstvärden mellan alla röster (en skala har bara ett fåtal)."""
+    if len(_VOTE_VALUES) >= 4096:
+        return value
+    try:
+        return _VOTE_VALUES.setdefault((type(value), value), value)
+    except TypeError:  # ohashbart
+        return value
+
+class VoteTable:
+    """Röster för en story som en lista indexerad med spelarens kolumn i
+    rummets PlayerIndex (None = ingen röst). Beter sig som en dict
+    spelar-id -> värde och serialiseras som en sådan."""
+
+    __slots__ = ("_players", "_values", "_n")
+
+    def __init__(self, players, votes=()):
+        self._players = players
+        self._values = []
+        self._n = 0
+        for pid, value in dict(votes).items():
+            self[pid] = value
+
+    def _slot(self, pid):
+        i = self._players.slots.get(pid)
+        return i if i is not None and i < len(self._values) else None
+
+    def __len__(self):
+        return self._n
+
+    def __bool__(self):
+        return self._n > 0
+
+    def __contains__(self, pid):
+        i = self._slot(pid)
+        return i is not None and self._values[i] is not None
+
+    def __getitem__(self, pid):
+        i = self._slot(pid)
+        if i is None or self._values[i] is None:
+            raise KeyError(pid)
+        return self._values[i]
+
+    def __setitem__(self, pid, value):
+        if value is None:
+            raise ValueError("None är ingen röst")
+        i = self._players.slot(pid)
+        if i >= len(self._values):
+            self._values.extend([None] * (i + 1 - len(self._values)))
+        if self._values[i] is None:
+            self._n += 1
+        self._values[i] = _intern_vote(value)
+
+    def get(self, pid, default=None):
+        i = self._slot(pid)
+        value = None if i is None else self._values[i]
+        return default if value is None else value
+
+    def pop(self, pid, *default):
+        i = self._slot(pid)
+        if i is None or self._values[i] is None:
+            if default:
+                return default[0]
+            raise KeyError(pid)
+        value, self._values[i] = self._values[i], None
+        self._n -= 1
+        while self._values and self._values[-1] is None:
+            self._values.pop()
+        return value
+
+    def items(self):
+        ids = self._players.ids
+        return [(ids[i], v) for i, v in enumerate(self._values) if v is not None]
+
+    def keys(self):
+        return [pid for pid, _ in self.items()]
+
+    def values(self):
+        return [v for v in self._values if v is not None]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def to_dict(self):
+        return dict(self.items())
+
+class VoteAgg(_Slotted):
+    """Löpande aggregat för en storys röster, se _agg_apply."""
+
+    __slots__ = ("n", "num_n", "sum", "sumsq", "hist")
+
+    def __init__(self, n=0, num_n=0, sum=0.0, sumsq=0.0, hist=None):
+        self.n = n
+        self.num_n = num_n
+        self.sum = sum
+        self.sumsq = sumsq
+        self.hist = {} if hist is None else hist
+
+def _agg_new():
+    return VoteAgg()
+
+def _agg_apply(agg, value, sign):
+    label = str(value)
+    agg.n += sign
+    count = agg.hist.get(label, 0) + sign
+    if count > 0:
+        agg.hist[label] = count
+    else:
+        agg.hist.pop(label, None)
+    try:
+        x = float(value)
+    except (TypeError, ValueError):
+        return
+    agg.num_n += sign
+    if agg.num_n == 0:
+        agg.sum = agg.sumsq = 0.0  # ingen avrundningsdrift kvar
+    else:
+        agg.sum += sign * x
+        agg.sumsq += sign * x * x
+
+def _agg_build(votes):
+    agg = _agg_new()
+    for value in votes.values():
+        _agg_apply(agg, value, 1)
+    return agg
+
+def record_vote(room, sid, pid, value):
+    """Sätter (eller ersätter) röst för spelar-id `pid` och uppdaterar aggregaten."""
+    votes = room["votes"].get(sid)
+    if votes is None:
+        votes = room["votes"][sid] = room.new_votes()
+    agg = room["agg"].setdefault(sid, _agg_new())
+    if pid in votes:
+        _agg_apply(agg, votes[pid], -1)
+    votes[pid] = value
+    _agg_apply(agg, value, 1)
+
+def clear_votes(room, sid):
+    room["votes"][sid] = room.new_votes()
+    room["agg"][sid] = _agg_new()
+
+def vote_stats(room, sid):
+    """Statistik för storyn ur aggregaten: antal, konsensus, medel/std och frekvenser."""
+    agg = room.get("agg", {}).get(sid) or _agg_new()
+    n = agg.n
+    # kopia: läsare itererar utan lås medan röster läggs till
+    counts = dict(agg.hist)
+    stats = {"count": n, "consensus": n > 0 and len(counts) == 1, "counts": counts}
+    if n and agg.num_n == n:
+        mean = agg.sum / n
+        stats["mean"] = mean
+        stats["stdev"] = math.sqrt(max(0.0, agg.sumsq / n - mean * mean))
+    else:
+        stats["error"] = True
+    return stats
+
+def all_have_voted(room):
+    """Sant när alla registrerade spelare röstat på den aktiva storyn.
+
+    Räknar per spelar-id i registret, så röster från spelare som lämnat
+    rummet kan inte dölja en registrerad spelare som inte röstat.
+    """
+    players = list(room.get("players") or ())
+    votes = room.get("votes", {}).get(room.get("active_story_id"))
+    return bool(players) and votes is not None and all(pid in votes for pid in players)
+
+# --- Rum ---
+class Room(_Slotted):
+    """Ett rum. Fälten är nycklarna i den serialiserade dicten (se rooms.new_room);
+    player_index finns bara i minnet och byggs upp från rösterna i from_dict."""
+
+    __slots__ = (
+        "schema", "created", "stories", "active_story_id",
+        "scale_mode", "scale", "scale_labels",
+        "votes", "revealed_for", "agg", "timer", "players", "pings",
+        "chat", "chat_seq", "last_update", "version",
+        "player_index",
+    )
+    _transient = ("player_index",)
+
+    def __init__(self, **fields):
+        self.player_index = PlayerIndex()
+        self.update(fields)
+
+    def new_votes(self, votes=()):
+        return VoteTable(self.player_index, votes)
+
+    def init_story(self, sid):
+        """Tomma röster, aggregat och avslöjad-flagga för en ny story."""
+        self.votes.setdefault(sid, self.new_votes())
+        self.revealed_for.setdefault(sid, False)
+        self.agg.setdefault(sid, _agg_new())
+
+    @classmethod
+    def from_dict(cls, d):
+        """Bygger ett rum ur en migrerad dict (från disk eller journal)."""
+        room = cls(**{k: v for k, v in d.items() if k in cls.__slots__ and k not in cls._transient})
+        room.stories = StoryList(Story.from_dict(s) for s in d.get("stories", ()))
+        # story-id:n förekommer i flera dictar; intern delar en sträng per id
+        room.votes = {sys.intern(sid): room.new_votes(v) for sid, v in d.get("votes", {}).items()}
+        room.revealed_for = {sys.intern(sid): v for sid, v in d.get("revealed_for", {}).items()}
+        room.agg = {
+            sys.intern(sid): VoteAgg(**{**a, "hist": {sys.intern(k): c for k, c in a.get("hist", {}).items()}}) if isinstance(a, dict) else a
+            for sid, a in d.get("agg", {}).items()
+        }
+        room.chat = deque(d.get("chat") or [], maxlen=CHAT_CAPACITY)
+        return room
@@ -0,0 +1,120 @@
+"""Åtkomst till rummen: ett gemensamt lager per process, läsning och
+ändring via update_room (som ökar versionen och väcker andra sessioner).
+Lagret är RoomStore (JSON) eller SqliteRoomStore, se STORE_BACKEND.
+Ändringar går genom en skrivare per rum (RoomWriter) som slår ihop skurar."""
+
+import time
+from collections import deque
+
+import streamlit as st
+
+from .chat import CHAT_CAPACITY
+from .hub import _session_id, room_hub
+from .metrics import metrics
+from .migrations import SCHEMA_VERSION, migrate_room, prepare_room
+from .model import DEFAULT_SCALE, DEFAULT_TSHIRT, Room, StoryList, _new_story
+from .sqlite_store import SqliteRoomStore
+from .store import DB_FILE, JOURNAL_FILE, STATE_FILE, STORE_BACKEND, RoomStore
+from .writer import RoomWriter
+
+def new_room():
+    first = _new_story()
+    room = Room(
+        # schemaversion, se MIGRATIONS
+        schema=SCHEMA_VERSION,
+        created=time.time(),
+        # Stories
+        stories=StoryList([first]),  # Story, se StoryList
+        active_story_id=first["id"],
+        # scale_mode: 'points' => uses 'scale' mapping; 'tshirt' => uses 'scale_labels'
+        scale_mode="points",
+        scale=DEFAULT_SCALE.copy(),
+        scale_labels=DEFAULT_TSHIRT[:],
+        # votes: story_id -> VoteTable (player_id -> value)
+        votes={},
+        # revealed_for: story_id -> bool
+        revealed_for={},
+        # agg: story_id -> VoteAgg, se record_vote
+        agg={},
+        timer={
+            "end": None,
+            "duration": 0,
+        },
+        # players: player_id -> visningsnamn (id:t följer sessionen)
+        players={},
+        # transient pings: player_id -> unix ts (gäller PING_TTL sekunder)
+        pings={},
+        # chat: ringbuffert av {seq, name, pid, text, ts}, se chat_append
+        chat=deque(maxlen=CHAT_CAPACITY),
+        chat_seq=0,
+        last_update=time.time(),
+        # monoton ändringsräknare, ökas av update_room
+        version=0,
+    )
+    room.init_story(first["id"])
+    return room
+
+@st.cache_resource
+def room_store():
+    # Ett gemensamt lager per process så att alla sessioner ser samma rum
+    if STORE_BACKEND == "sqlite":
+        store = SqliteRoomStore(DB_FILE, prepare=prepare_room, import_from=(STATE_FILE, JOURNAL_FILE))
+        # rum som andra processer ändrat väcker sessionerna här
+        store.on_change = room_hub().publish
+        return store
+    return RoomStore(STATE_FILE, JOURNAL_FILE, prepare=prepare_room)
+
+def load_rooms():
+    """Returnerar alla rum, även de som vräkts ur minnet eller bara finns i databasen."""
+    return room_store().all_rooms()
+
+def save_rooms(rooms, room_code=None):
+    """Schemalägger att rummet skrivs till journalen (batchas i bakgrunden)."""
+    if room_code is not None:
+        room_store().mark_dirty(room_code)
+
+def _apply_mutation(room, mutate_fn):
+    migrate_room(room)
+    try:
+        mutate_fn(room)
+    finally:
+        # ett kommando som kastar kan ha hunnit ändra rummet, och det sparas
+        # med resten av batchen; ny version så att cachar och fragment ser det
+        room["last_update"] = time.time()
+        room["version"] = room.get("version", 0) + 1
+
+@st.cache_resource
+def room_writer():
+    m = metrics()
+    return RoomWriter(room_store(), _apply_mutation, new_room,
+                      on_commit=lambda code, n: m.inc("commits", code))
+
+def update_room(room_code, mutate_fn):
+    """Köar mutate_fn för rummet och väntar tills den skrivits; returnerar nya versionen.
+
+    mutate_fn kan köras i en annan sessions tråd (se RoomWriter) och får inte
+    röra `st.*`; läs värden ur session_state före anropet och bind in dem.
+    """
+    m = metrics()
+    with m.span("store_write"):
+        version = room_writer().submit(room_code, mutate_fn)
+        room_hub().publish(room_code, origin=_session_id())
+    m.inc("mutations", room_code)
+    return version
+
+def get_room(room_code):
+    store = room_store()
+    with metrics().span("store_read"):
+        room = store.get(room_code)
+        if room is None:
+            return None
+        if room.get("schema", 0) < SCHEMA_VERSION:
+            with store.lock:
+                if migrate_room(room):
+                    save_rooms(store.rooms, room_code)
+    return room
+
+def room_version(room_code):
+    """Returnerar rummets versionsräknare (None om rummet saknas)."""
+    room = room_store().get(room_code)
+    return None if room is None else room.get("version", 0)
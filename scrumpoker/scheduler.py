@@ -0,0 +1,120 @@
+"""Tidsstyrda händelser på servern, t.ex. auto-reveal när rummets timer gått ut.
+
+En bakgrundstråd per process väntar på närmaste deadline i en heap, så
+ingen session behöver köras om varje sekund för att upptäcka att tiden är
+slut. Nedräkningen visas i webbläsaren (se `countdown_html`).
+"""
+
+import heapq
+import itertools
+import threading
+import time
+
+import streamlit as st
+
+from .hub import room_hub
+from .rooms import get_room, update_room
+
+class Scheduler:
+    """Heap av (deadline, nr, nyckel); en nyckel har högst en aktiv deadline.
+
+    `schedule` med en ny deadline för samma nyckel ersätter den gamla (den
+    gamla posten ligger kvar i heapen men hoppas över när den poppas).
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._jobs = {}  # nyckel -> (deadline, nr, fn)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="scrumpoker-scheduler", daemon=True)
+        self._thread.start()
+
+    def schedule(self, key, deadline, fn):
+        with self._cond:
+            job = self._jobs.get(key)
+            if job is not None and job[0] == deadline:
+                return
+            n = next(self._seq)
+            self._jobs[key] = (deadline, n, fn)
+            heapq.heappush(self._heap, (deadline, n, key))
+            if self._heap[0][1] == n:
+                self._cond.notify()
+
+    def cancel(self, key):
+        with self._cond:
+            self._jobs.pop(key, None)
+
+    def pending(self, key):
+        with self._cond:
+            job = self._jobs.get(key)
+            return None if job is None else job[0]
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    while self._heap and self._jobs.get(self._heap[0][2], (None, None))[1] != self._heap[0][1]:
+                        heapq.heappop(self._heap)  # ersatt eller avbruten
+                    if not self._heap:
+                        self._cond.wait()
+                        continue
+                    delay = self._heap[0][0] - time.time()
+                    if delay <= 0:
+                        break
+                    self._cond.wait(delay)
+                _, _, key = heapq.heappop(self._heap)
+                fn = self._jobs.pop(key)[2]
+            try:
+                fn()
+            except Exception:
+                pass  # ett misslyckat jobb får inte stoppa schemaläggaren
+
+@st.cache_resource
+def scheduler():
+    return Scheduler()
+
+# --- Timer ---
+
+def _timer_expired(room_code, end):
+    room = get_room(room_code)
+    if room is None or (room.get("timer") or {}).get("end") != end:
+        return  # stoppad eller omstartad
+    if room["revealed_for"].get(room.get("active_story_id"), False):
+        room_hub().publish(room_code)  # visa "Tid slut!" ändå
+        return
+
+    def auto_reveal(r):
+        if (r.get("timer") or {}).get("end") == end:
+            r["revealed_for"][r.get("active_story_id")] = True
+    update_room(room_code, auto_reveal)
+
+def schedule_timer(room_code, end):
+    """Ser till att rummets timer avslöjar rösterna när den går ut.
+
+    Anropas vid varje körning med en gående timer, så schemat återskapas
+    efter en omstart; samma deadline igen är en no-op.
+    """
+    key = ("timer", room_code)
+    if end:
+        scheduler().schedule(key, end, lambda: _timer_expired(room_code, end))
+    else:
+        scheduler().cancel(key)
+
+def countdown_html(end, now=None):
+    """Nedräkning till `end` som räknas ned i webbläsaren (CSS-animation).
+
+    Sekunderna är en registrerad heltals-property (`--sp-left`) som animeras
+    stegvis till 0, så siffrorna byts utan omkörningar. Startvärdet räknas
+    ut här, vilket gör att klientens klocka inte spelar roll.
+    """
+    now = now or time.time()
+    remaining = max(0.0, end - now)
+    whole = int(-(-remaining // 1))  # uppåt avrundat
+    if whole == 0:
+        return "<span>0</span>"
+    return (
+        f"<span class='sp-countdown' style='--sp-from:{whole};"
+        f"animation-duration:{whole}s;animation-timing-function:steps({whole});"
+        f"animation-delay:-{whole - remaining:.3f}s'></span>"
+    )
@@ -0,0 +1,89 @@
+"""Sessionsnära hjälpare för sidan: rum-snapshot per session och
+pollintervallet. Renderat innehåll delas mellan sessioner, se fragments."""
+
+import time
+import uuid
+
+import streamlit as st
+
+from .chat import active_pings
+from .hub import room_hub
+from .rooms import get_room, room_version
+
+PLAYER_PARAM = "pid"
+
+def session_player_id():
+    """Spelarens stabila id; röster och pingar nycklas med det.
+
+    Id:t sparas i adressen (?pid=...), så en omladdning av sidan behåller
+    samma spelare i stället för att registrera en ny. Omkörningar som hubben
+    begär saknar query-parametrar, därför läses session_state först.
+    """
+    pid = st.session_state.get("player_id")
+    if pid is None:
+        pid = st.query_params.get(PLAYER_PARAM) or ""
+        if not (pid.isalnum() and len(pid) <= 32):
+            pid = uuid.uuid4().hex[:12]
+        st.session_state["player_id"] = pid
+        st.query_params[PLAYER_PARAM] = pid
+    return pid
+
+def cached_room(room_code):
+    """Returnerar rummet via sessionens senaste snapshot.
+
+    Vi undviker fortfarande @st.cache_data (cache + `st_autorefresh` gav
+    föråldrad data). Istället jämförs rummets `version` med den version
+    sessionen senast såg: är den oförändrad återanvänds snapshoten direkt
+    och `migrate_room` hoppas över.
+    """
+    current = room_version(room_code)
+    if current is None:
+        return None
+    snap = st.session_state.get("_room_snapshot")
+    if snap and snap[0] == room_code and snap[1] == current:
+        return snap[2]
+    room = get_room(room_code)
+    st.session_state["_room_snapshot"] = (room_code, room.get("version", 0), room)
+    return room
+
+# --- Uppdateringsschema ---
+# En enda autorefresh per session. Ändringar skjuts normalt ut via hubben,
+# så pollningen är ett skyddsnät som backar av i lugna rum.
+REFRESH_TICK = 1000  # pingar släcks per sekund
+REFRESH_DEADLINE_SLACK = 150  # ms efter en deadline innan omkörningen
+REFRESH_FAST = 2000
+REFRESH_MAX = 120000
+REFRESH_MAX_POLL = 60000  # utan hub (ingen Streamlit-runtime) pollas oftare
+REFRESH_IDLE_AFTER = 15 * 60  # sekunder utan ändring => direkt till REFRESH_MAX
+
+def refresh_interval(room, now=None):
+    """Väljer sessionens pollintervall (ms) utifrån aktiviteten i rummet.
+
+    Nedräkning och timer räknas ned i webbläsaren; Play-nedräkningen ger
+    en enda omkörning när den är klar och timern avslöjas av
+    schemaläggaren (utan hub körs sessionen om när timern gått ut). Annars
+    börjar vi på REFRESH_FAST när rummets version ändrats sedan förra
+    körningen och fördubblar intervallet för varje körning utan ändring,
+    upp till REFRESH_MAX (REFRESH_MAX_POLL utan hub).
+    """
+    now = now or time.time()
+    hub = room_hub().available
+    refresh_max = REFRESH_MAX if hub else REFRESH_MAX_POLL
+    if st.session_state.get("play_state") == "countdown":
+        end_ct = st.session_state.get("play_countdown_end") or now
+        return max(REFRESH_TICK // 4, int((end_ct - now) * 1000) + REFRESH_DEADLINE_SLACK)
+    end = (room.get("timer") or {}).get("end")
+    if end and end > now and not hub:
+        refresh_max = min(refresh_max, max(REFRESH_TICK, int((end - now) * 1000) + REFRESH_DEADLINE_SLACK))
+    if active_pings(room, now):
+        return REFRESH_TICK  # så att pingen släcks när den gått ut
+    version = room.get("version", 0)
+    prev = st.session_state.get("_refresh_seen")
+    if prev is None or prev[0] != version:
+        interval = min(refresh_max, REFRESH_FAST)
+    elif now - room.get("last_update", now) > REFRESH_IDLE_AFTER:
+        interval = refresh_max
+    else:
+        interval = min(refresh_max, max(REFRESH_FAST, prev[1] * 2))
+    st.session_state["_refresh_seen"] = (version, interval)
+    return interval
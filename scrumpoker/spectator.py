@@ -0,0 +1,106 @@
+"""Åskådarläge (storbild): en delad, förrenderad vy per rum.
+
+Åskådare registreras aldrig som spelare och skriver aldrig till rummet.
+Vyn (HTML för story och statistik samt kortens data) byggs en gång per
+rumsversion och delas av alla åskådarsessioner i processen, så N åskådare
+kostar ungefär en rendering per ändring.
+"""
+
+from html import escape
+from urllib.parse import urlencode
+
+import streamlit as st
+
+from .fragments import shared_memo
+from .hub import room_hub
+from .model import active_story, vote_stats
+from .rooms import room_store
+from .session import REFRESH_FAST, REFRESH_MAX
+
+SPECTATOR_PARAM = "view"
+SPECTATOR_VALUE = "spectator"
+
+def is_spectator():
+    """Sant för en åskådarsession.
+
+    Läget och rummet sparas i session_state första körningen: omkörningar
+    som hubben begär (request_rerun) saknar query-parametrar, och en
+    åskådare får aldrig falla tillbaka till deltagarvyn.
+    """
+    if st.query_params.get(SPECTATOR_PARAM) == SPECTATOR_VALUE:
+        st.session_state["_spectator_room"] = (
+            st.query_params.get("room") or st.session_state.get("room_code") or "TEAM1"
+        )
+    return "_spectator_room" in st.session_state
+
+def spectator_room():
+    return st.session_state["_spectator_room"]
+
+def spectator_url(room_code):
+    return "?" + urlencode({SPECTATOR_PARAM: SPECTATOR_VALUE, "room": room_code})
+
+def _build_view(room_code, room):
+    sid = room.get("active_story_id")
+    stories = room.get("stories") or ()
+    story = active_story(room) or {}
+    position = next((i for i, s in enumerate(stories, 1) if s["id"] == sid), 0)
+    players = room.get("players") or {}
+    votes = room.get("votes", {}).get(sid) or {}
+    revealed = bool(room.get("revealed_for", {}).get(sid))
+    text = (story.get("text") or "").strip() or f"User Story {position}"
+
+    parts = [
+        f"<div class='spectator-head'>Rum {escape(room_code)} • Story {position} av {len(stories)}</div>",
+        f"<div class='spectator-story'>{escape(text).replace(chr(10), '<br>')}</div>",
+        f"<div class='spectator-status'>Röster: {len(votes)} / {len(players)}"
+        f"{' • avslöjade' if revealed else ''}</div>",
+    ]
+    if revealed and votes:
+        stats = vote_stats(room, sid)
+        if room.get("scale_mode", "points") == "points" and not stats.get("error"):
+            parts.append(
+                f"<div class='spectator-stats'>Medel {stats['mean']:.2f} • Stdavvikelse {stats['stdev']:.2f}</div>"
+            )
+        else:
+            freq = " • ".join(f"{escape(str(label))}: {n}" for label, n in stats["counts"].items())
+            parts.append(f"<div class='spectator-stats'>{freq}</div>")
+        if stats["consensus"]:
+            parts.append("<span class='consensus'>✅ Konsensus uppnådd!</span>")
+        else:
+            parts.append("<span class='warning'>⚠️ Ingen konsensus ännu</span>")
+
+    cards = []
+    for pid, name in sorted(players.items(), key=lambda kv: (kv[1], kv[0])):
+        flip = revealed and pid in votes
+        cards.append({
+            "key": pid,
+            "name": str(name),
+            "value": str(votes.get(pid, "?")) if flip else "?",
+            "flip": flip,
+            "pinged": False,
+        })
+    return {
+        "html": "<div class='spectator'>" + "".join(parts) + "</div>",
+        "cards": cards,
+        "timer_end": (room.get("timer") or {}).get("end"),
+    }
+
+def spectator_view(room_code):
+    """Vyn för rummets aktuella version, eller None om rummet saknas.
+
+    Byggs under lagrets lås och delas via fragment-cachen, så alla åskådare
+    i rummet får samma objekt tills versionen ändras.
+    """
+    store = room_store()
+    room = store.get(room_code)
+    if room is None:
+        return None
+
+    def build():
+        with store.lock:
+            return _build_view(room_code, store.get(room_code) or room)
+    return shared_memo(("spectator", room_code), room.get("version", 0), build)
+
+def spectator_refresh():
+    """Åskådare väcks av hubben vid ändringar; pollningen är bara ett skyddsnät."""
+    return REFRESH_MAX if room_hub().available else REFRESH_FAST
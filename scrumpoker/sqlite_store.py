@@ -0,0 +1,261 @@
+"""Rumslager i SQLite (WAL) så att flera processer på samma värd kan dela rum.
+
+En rad per rum: `code`, `version` (rummets versionsräknare), `seq` (global
+ändringsräknare, ökas vid varje skrivning) och rummet som JSON. Ändringar
+görs i en `BEGIN IMMEDIATE`-transaktion som läser om rummet om en annan
+process hunnit skriva en nyare version, så inga uppdateringar går förlorade.
+En bakgrundstråd frågar efter rader med `seq` högre än senast sedda
+(`changed_since`) och läser in rum som andra processer ändrat.
+"""
+
+import json
+import sqlite3
+import threading
+import time
+
+from .store import MAX_ROOMS, ROOM_IDLE_TTL, ROOM_MIN_IDLE, _dumps, read_state
+
+POLL_INTERVAL = 0.25  # sekunder mellan frågor efter andra processers ändringar
+EVICT_INTERVAL = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rooms (
+    code TEXT PRIMARY KEY,
+    version INTEGER NOT NULL,
+    seq INTEGER NOT NULL,
+    updated REAL NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS rooms_seq ON rooms (seq);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('seq', 0);
+"""
+
+class SqliteRoomStore:
+    """Samma yta som RoomStore, med SQLite som delad sanning.
+
+    `rooms` är processens cache. Den hålls aktuell av pollningen, och
+    `mutate` kontrollerar alltid versionen mot databasen innan den ändrar.
+    `on_change(kod)` anropas när pollningen läst in ett rum som en annan
+    process ändrat (används för att väcka sessionerna som tittar på det).
+    """
+
+    def __init__(self, path, prepare=None, import_from=None, poll_interval=POLL_INTERVAL,
+                 idle_ttl=ROOM_IDLE_TTL, max_rooms=MAX_ROOMS):
+        self.path = path
+        self.prepare = prepare
+        self.poll_interval = poll_interval
+        self.idle_ttl = idle_ttl
+        self.max_rooms = max_rooms
+        self.on_change = None
+        self.rooms = {}
+        self.access = {}
+        self.sizes = {}
+        self.lock = threading.RLock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        if import_from is not None:
+            self._import_json(*import_from)
+        self._seen_seq = 0
+        self.load()
+        self._stop = threading.Event()
+        self._last_evict = time.time()
+        self._thread = threading.Thread(target=self._run, name="room-store-poller", daemon=True)
+        self._thread.start()
+
+    def _prepare(self, data):
+        room = json.loads(data)
+        if self.prepare is not None:
+            room, _ = self.prepare(room)
+        return room
+
+    def _import_json(self, state_path, journal_path):
+        """Fyller en tom databas från JSON-lagret (snapshot + journal)."""
+        with self.lock:
+            if self._conn.execute("SELECT 1 FROM rooms LIMIT 1").fetchone():
+                return
+            rooms, _ = read_state(state_path, journal_path)
+            if not rooms:
+                return
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for code, room in rooms.items():
+                    if self.prepare is not None:
+                        room, _ = self.prepare(room)
+                    self._write(code, room)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def load(self):
+        with self.lock:
+            rows = self._conn.execute("SELECT code, seq, data FROM rooms").fetchall()
+            for code, seq, data in rows:
+                self.rooms[code] = self._prepare(data)
+                self.sizes[code] = len(data)
+                self._seen_seq = max(self._seen_seq, seq)
+
+    def _next_seq(self):
+        self._conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'seq'")
+        return self._conn.execute("SELECT value FROM meta WHERE key = 'seq'").fetchone()[0]
+
+    def _write(self, code, room):
+        data = _dumps(room)
+        self._conn.execute(
+            "INSERT INTO rooms (code, version, seq, updated, data) VALUES (?, ?, ?, ?, ?) "
+            "ON CONFLICT (code) DO UPDATE SET version = excluded.version, seq = excluded.seq, "
+            "updated = excluded.updated, data = excluded.data",
+            (code, room.get("version", 0), self._next_seq(), time.time(), data),
+        )
+        self.sizes[code] = len(data)
+
+    def get(self, room_code):
+        """Rummet ur cachen, eller läst från databasen om det inte finns där."""
+        room = self.rooms.get(room_code)
+        if room is None:
+            with self.lock:
+                row = self._conn.execute("SELECT data FROM rooms WHERE code = ?", (room_code,)).fetchone()
+                if row is not None:
+                    room = self.rooms[room_code] = self._prepare(row[0])
+        if room is not None:
+            self.access[room_code] = time.time()
+        return room
+
+    def mutate(self, room_code, fn, create):
+        """Kör fn(rum) och skriver rummet i en transaktion.
+
+        Har en annan process skrivit en nyare version läses den in först. Om
+        fn kastar rullas transaktionen tillbaka och rummet tas ur cachen.
+        RoomWriter fångar däremot fel per kommando inne i fn, så där sparas
+        ett kastande kommandos ändringar med resten av batchen (med ny
+        version, se rooms._apply_mutation).
+        """
+        with self.lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT version, data FROM rooms WHERE code = ?", (room_code,)).fetchone()
+                room = self.rooms.get(room_code)
+                if row is None:
+                    room = create()
+                elif room is None or room.get("version", 0) != row[0]:
+                    room = self._prepare(row[1])
+                fn(room)
+                self._write(room_code, room)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                self.rooms.pop(room_code, None)
+                raise
+            self.rooms[room_code] = room
+            self.access[room_code] = time.time()
+        return room
+
+    def mark_dirty(self, room_code):
+        """Skriver cachens version av rummet (t.ex. efter en migrering).
+
+        Samma versionskontroll som i `mutate`: har en annan process hunnit
+        skriva läses dess version in i cachen i stället för att skrivas över.
+        """
+        with self.lock:
+            room = self.rooms.get(room_code)
+            if room is None:
+                return
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT version, data FROM rooms WHERE code = ?", (room_code,)).fetchone()
+                if row is not None and room.get("version", 0) != row[0]:
+                    self.rooms[room_code] = self._prepare(row[1])
+                    self.sizes[room_code] = len(row[1])
+                else:
+                    self._write(room_code, room)
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def all_rooms(self):
+        """{kod: rum} för alla rum i databasen, inte bara de i cachen.
+
+        Rum i cachen med samma version som databasen tas därifrån; övriga
+        läses ur databasen utan att läggas i cachen.
+        """
+        with self.lock:
+            versions = self._conn.execute("SELECT code, version FROM rooms").fetchall()
+        rooms = {}
+        for code, version in versions:
+            room = self.rooms.get(code)
+            if room is None or room.get("version", 0) != version:
+                with self.lock:
+                    row = self._conn.execute("SELECT data FROM rooms WHERE code = ?", (code,)).fetchone()
+                if row is None:
+                    continue
+                room = self._prepare(row[0])
+            rooms[code] = room
+        return rooms
+
+    def change_seq(self):
+        """Databasens globala ändringsräknare (alla processers skrivningar)."""
+        with self.lock:
+            return self._conn.execute("SELECT value FROM meta WHERE key = 'seq'").fetchone()[0]
+
+    def changed_since(self, seq):
+        """[(kod, version, seq)] för rum skrivna efter `seq` (indexuppslag)."""
+        with self.lock:
+            return self._conn.execute(
+                "SELECT code, version, seq FROM rooms WHERE seq > ? ORDER BY seq", (seq,)
+            ).fetchall()
+
+    def room_bytes(self, room_code):
+        return self.sizes.get(room_code, 0)
+
+    def poll(self):
+        """Läser in rum som andra processer ändrat; returnerar deras koder."""
+        changed = []
+        for code, version, seq in self.changed_since(self._seen_seq):
+            self._seen_seq = max(self._seen_seq, seq)
+            with self.lock:
+                room = self.rooms.get(code)
+                if room is None or room.get("version", 0) >= version:
+                    continue  # inte i cachen (läses vid behov) eller egen skrivning
+                row = self._conn.execute("SELECT data FROM rooms WHERE code = ?", (code,)).fetchone()
+                if row is None:
+                    continue
+                self.rooms[code] = self._prepare(row[0])
+                self.sizes[code] = len(row[0])
+            changed.append(code)
+        return changed
+
+    def evict(self, now=None):
+        """Släpper inaktiva rum ur cachen; databasen har dem kvar."""
+        now = now or time.time()
+        with self.lock:
+            last_used = {c: max(self.access.get(c, 0), r.get("last_update", 0)) for c, r in self.rooms.items()}
+            order = sorted(last_used, key=last_used.get)
+            victims = [c for c in order if now - last_used[c] > self.idle_ttl]
+            remaining = order[len(victims):]
+            while len(remaining) > self.max_rooms and now - last_used[remaining[0]] >= ROOM_MIN_IDLE:
+                victims.append(remaining.pop(0))
+            for code in victims:
+                self.rooms.pop(code, None)
+                self.access.pop(code, None)
+                self.sizes.pop(code, None)
+        return victims
+
+    def _run(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                for code in self.poll():
+                    if self.on_change is not None:
+                        self.on_change(code)
+                now = time.time()
+                if now - self._last_evict >= EVICT_INTERVAL:
+                    self._last_evict = now
+                    self.evict(now)
+            except Exception:
+                pass  # nästa varv försöker igen
+
+    def close(self):
+        self._stop.set()
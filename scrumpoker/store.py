@@ -0,0 +1,422 @@
+"""Rumslagret: rummen i minnet, journal + snapshot på disk och vräkning."""
+
+import atexit
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+# Rummen hålls i minnet (delat mellan alla sessioner i processen) och
+# skrivs till disk som en snapshot (`rooms_state.json`) plus en journal
+# med ändrade rum. Journalen skrivs i batch från en bakgrundstråd så att
+# röstning aldrig väntar på disk.
+STATE_FILE = os.environ.get(
+    "SCRUMPOKER_STATE_FILE",
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "rooms_state.json"),
+)
+JOURNAL_FILE = os.path.splitext(STATE_FILE)[0] + ".journal.jsonl"
+# "json" (en process, ovan) eller "sqlite" (flera processer delar DB_FILE)
+STORE_BACKEND = os.environ.get("SCRUMPOKER_STORE", "json")
+DB_FILE = os.environ.get("SCRUMPOKER_DB", os.path.splitext(STATE_FILE)[0] + ".db")
+FLUSH_INTERVAL = 0.5  # sekunder mellan journal-batchar
+COMPACT_EVERY = 2000  # journalposter innan ny snapshot skrivs
+# Varje journalpost är ett helt rum, så stora rum fyller journalen snabbt.
+# Ny snapshot även när journalen blivit COMPACT_RATIO gånger större än den
+# senaste snapshoten (minst COMPACT_MIN_BYTES), så att disk och uppspelning
+# vid start hålls till några få snapshots oavsett rummens storlek.
+COMPACT_RATIO = 2
+COMPACT_MIN_BYTES = 4 * 1024 * 1024
+ERROR_LOG_INTERVAL = 60  # sekunder mellan upprepade loggrader om samma fel
+
+# Vräkning av inaktiva rum. Vräkta rum med innehåll sparas som en fil per rum
+# i SPILL_DIR och läses in igen vid nästa åtkomst; tomma rum tas bort.
+ROOM_IDLE_TTL = float(os.environ.get("SCRUMPOKER_ROOM_TTL", 24 * 3600))
+MAX_ROOMS = int(os.environ.get("SCRUMPOKER_MAX_ROOMS", 500))
+MAX_ROOM_BYTES = int(os.environ.get("SCRUMPOKER_MAX_ROOM_BYTES", 200 * 1024 * 1024))
+ROOM_MIN_IDLE = 300  # rum använda senaste 5 min vräks aldrig
+EVICT_INTERVAL = 60  # sekunder mellan vräkningsrundor
+SPILL_DIR = None if os.environ.get("SCRUMPOKER_SPILL", "1") == "0" else os.path.join(os.path.dirname(STATE_FILE), "rooms_spill")
+SPILL_TTL = 30 * 24 * 3600  # spill-filer äldre än så tas bort
+
+log = logging.getLogger(__name__)
+
+def _json_default(o):
+    if isinstance(o, (set, frozenset, deque)):
+        return list(o)
+    if hasattr(o, "to_list"):  # StoryList
+        return o.to_list()
+    if hasattr(o, "to_dict"):  # Room, Story, VoteTable, VoteAgg
+        return o.to_dict()
+    raise TypeError(f"Kan inte serialisera {type(o).__name__}")
+
+def _dumps(obj):
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False, default=_json_default)
+
+def _fsync_dir(path):
+    try:
+        fd = os.open(os.path.dirname(path) or ".", os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def read_state(state_path, journal_path):
+    """Läser snapshoten och spelar upp journalen ovanpå.
+
+    Returnerar (rum som dictar, antal journalposter). Poster med lägre
+    version än snapshoten ignoreras, liksom en avhuggen sista rad.
+    """
+    rooms = {}
+    try:
+        with open(state_path, encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            rooms = data
+    except (OSError, ValueError):
+        pass
+    records = 0
+    try:
+        with open(journal_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    break  # avhuggen rad efter krasch
+                records += 1
+                code = rec.get("r")
+                if rec.get("x"):
+                    rooms.pop(code, None)
+                    continue
+                cur = rooms.get(code)
+                if cur is None or rec.get("v", 0) >= cur.get("version", 0):
+                    rooms[code] = rec["d"]
+    except OSError:
+        pass
+    return rooms, records
+
+# Ett rumslager har samma yta oavsett backend (RoomStore här, SqliteRoomStore
+# i sqlite_store): `rooms` (rummen i minnet), `lock`, `get(kod)`,
+# `mutate(kod, fn, create)` som kör fn på rummet som en transaktion,
+# `mark_dirty(kod)`, `all_rooms()` (även rum som inte är i minnet),
+# `change_seq()` (ökar vid varje ändring i något rum), `room_bytes(kod)`
+# och `close()`.
+
+class RoomStore:
+    """Rum i minnet med snapshot + append-only journal på disk.
+
+    Varje journalrad är `{"r": rumskod, "v": version, "d": rum}` (eller
+    `{"r": rumskod, "x": 1}` för borttaget rum). Vid start läses snapshoten
+    och journalen spelas upp ovanpå; poster med lägre version än snapshoten
+    ignoreras, liksom en avhuggen sista rad efter en krasch.
+    """
+
+    def __init__(self, state_path, journal_path, prepare=None, flush_interval=FLUSH_INTERVAL,
+                 compact_every=COMPACT_EVERY, spill_dir=SPILL_DIR, idle_ttl=ROOM_IDLE_TTL,
+                 max_rooms=MAX_ROOMS, max_bytes=MAX_ROOM_BYTES, compact_ratio=COMPACT_RATIO,
+                 compact_min_bytes=COMPACT_MIN_BYTES):
+        self.state_path = state_path
+        self.journal_path = journal_path
+        # anropas för varje rum som läses från disk; True => rummet ändrades
+        self.prepare = prepare
+        self.flush_interval = flush_interval
+        self.compact_every = compact_every
+        self.compact_ratio = compact_ratio
+        self.compact_min_bytes = compact_min_bytes
+        self.spill_dir = spill_dir
+        self.idle_ttl = idle_ttl
+        self.max_rooms = max_rooms
+        self.max_bytes = max_bytes
+        self.rooms = {}
+        # senaste åtkomst och serialiserad storlek (bytes) per rum
+        self.access = {}
+        self.sizes = {}
+        self._last_evict = time.time()
+        self._last_spill_gc = 0.0
+        # skyddar mutationer av rummen mot samtidig serialisering
+        self.lock = threading.RLock()
+        self._dirty = set()
+        self._dirty_lock = threading.Lock()
+        self._changes = 0
+        self._journal_records = 0
+        self._journal_bytes = 0
+        self._snapshot_bytes = 0
+        self._failing_since = None  # tid för första felet i en följd av misslyckade batchar
+        self._last_error_log = 0.0
+        self._stop = threading.Event()
+        self.load()
+        self._thread = threading.Thread(target=self._run, name="room-store-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def load(self):
+        rooms, records = read_state(self.state_path, self.journal_path)
+        if self.prepare is not None:
+            for code, room in rooms.items():
+                rooms[code], changed = self.prepare(room)
+                if changed:
+                    self._dirty.add(code)
+        self.rooms = rooms
+        self._journal_records = records
+        self._journal_bytes = self._file_size(self.journal_path)
+        self._snapshot_bytes = self._file_size(self.state_path)
+
+    @staticmethod
+    def _file_size(path):
+        try:
+            return os.path.getsize(path)
+        except OSError:
+            return 0
+
+    def _compact_due(self):
+        limit = max(self.compact_min_bytes, self.compact_ratio * self._snapshot_bytes)
+        return self._journal_records >= self.compact_every or self._journal_bytes >= limit
+
+    def get(self, room_code):
+        """Returnerar rummet (läser in det från spill-katalogen om det vräkts)."""
+        room = self.rooms.get(room_code)
+        if room is None and self.spill_dir:
+            room = self._unspill(room_code)
+        if room is not None:
+            self.access[room_code] = time.time()
+        return room
+
+    def mutate(self, room_code, fn, create):
+        """Kör fn(rum) under låset; create() skapar rummet om det saknas.
+
+        Ett vräkt rum läses in igen under låset (RLock), så en vräkning
+        mellan uppslag och ändring kan inte ersätta rummet med ett tomt.
+        """
+        with self.lock:
+            room = self.rooms.get(room_code)
+            if room is None and self.spill_dir:
+                room = self._unspill(room_code)
+            if room is None:
+                room = self.rooms[room_code] = create()
+            self.access[room_code] = time.time()
+            fn(room)
+        self.mark_dirty(room_code)
+        return room
+
+    def room_bytes(self, room_code):
+        """Ungefärlig minnesåtgång för rummet: storleken på senaste serialisering."""
+        size = self.sizes.get(room_code)
+        if size is None:
+            room = self.rooms.get(room_code)
+            if room is None:
+                return 0
+            with self.lock:
+                size = self.sizes[room_code] = len(_dumps(room))
+        return size
+
+    @staticmethod
+    def _spill_name(room_code):
+        return "".join(ch if ch.isalnum() or ch in "-_" else f"%{ord(ch):x}" for ch in room_code)
+
+    def _spill_path(self, room_code):
+        return os.path.join(self.spill_dir, f"{self._spill_name(room_code)}.json")
+
+    def _unspill(self, room_code):
+        path = self._spill_path(room_code)
+        if not os.path.exists(path):
+            return None
+        with self.lock:
+            room = self.rooms.get(room_code)
+            if room is not None:
+                return room
+            try:
+                with open(path, encoding="utf-8") as f:
+                    room = json.load(f)
+            except (OSError, ValueError):
+                return None
+            if self.prepare is not None:
+                room, _ = self.prepare(room)
+            self.rooms[room_code] = room
+        self.mark_dirty(room_code)
+        return room
+
+    def all_rooms(self):
+        """{kod: rum} för rummen i minnet och de vräkta i spill-katalogen.
+
+        Vräkta rum läses utan att läggas tillbaka i minnet; de nycklas på
+        filnamnet, som är unikt per rum. En spill-fil för ett rum som lästs
+        in igen hoppas över (minnets version gäller).
+        """
+        with self.lock:
+            rooms = dict(self.rooms)
+        if not self.spill_dir:
+            return rooms
+        in_memory = {self._spill_name(code) for code in rooms}
+        try:
+            entries = list(os.scandir(self.spill_dir))
+        except OSError:
+            return rooms
+        for entry in entries:
+            name, ext = os.path.splitext(entry.name)
+            if ext != ".json" or name in in_memory:
+                continue
+            try:
+                with open(entry.path, encoding="utf-8") as f:
+                    room = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if self.prepare is not None:
+                room, _ = self.prepare(room)
+            rooms[name] = room
+        return rooms
+
+    @staticmethod
+    def _has_content(room):
+        return bool(room.get("chat")) or any(room.get("votes", {}).values()) or any(
+            (s.get("text") or "").strip() for s in room.get("stories", ())
+        )
+
+    def evict(self, now=None):
+        """Vräker rum som varit inaktiva längre än idle_ttl, och därefter de
+        minst nyligen använda tills antal och bytes ryms under taken."""
+        now = now or time.time()
+        with self.lock:
+            last_used = {c: max(self.access.get(c, 0), r.get("last_update", 0)) for c, r in self.rooms.items()}
+        order = sorted(last_used, key=last_used.get)
+        victims = [c for c in order if now - last_used[c] > self.idle_ttl]
+        remaining = order[len(victims):]
+        total = sum(self.room_bytes(c) for c in remaining)
+        while remaining and (len(remaining) > self.max_rooms or total > self.max_bytes):
+            if now - last_used[remaining[0]] < ROOM_MIN_IDLE:
+                break
+            code = remaining.pop(0)
+            victims.append(code)
+            total -= self.room_bytes(code)
+        evicted = [code for code in victims if self._evict_one(code, last_used[code])]
+        return evicted
+
+    def _evict_one(self, room_code, last_used):
+        """Vräker rummet om det inte använts sedan `last_used`; sant om det vräktes."""
+        with self.lock:
+            room = self.rooms.get(room_code)
+            if room is None:
+                return False
+            if max(self.access.get(room_code, 0), room.get("last_update", 0)) > last_used:
+                return False  # använt efter att evict valde det
+            if self.spill_dir and self._has_content(room):
+                # skriv rummet till disk innan det tas bort ur minnet (och journalen)
+                os.makedirs(self.spill_dir, exist_ok=True)
+                path = self._spill_path(room_code)
+                with open(path + ".tmp", "w", encoding="utf-8") as f:
+                    f.write(_dumps(room))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(path + ".tmp", path)
+            del self.rooms[room_code]
+            self.access.pop(room_code, None)
+            self.sizes.pop(room_code, None)
+        self.mark_dirty(room_code)  # journalför borttaget
+        return True
+
+    def _gc_spill(self, now):
+        try:
+            entries = list(os.scandir(self.spill_dir))
+        except OSError:
+            return
+        for entry in entries:
+            try:
+                if now - entry.stat().st_mtime > SPILL_TTL:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+
+    def mark_dirty(self, room_code):
+        with self._dirty_lock:
+            self._dirty.add(room_code)
+            self._changes += 1
+
+    def change_seq(self):
+        """Räknare som ökar vid varje ändring, vräkning och inläsning av ett rum."""
+        return self._changes
+
+    def flush(self):
+        """Skriver alla ändrade rum som en batch till journalen (med fsync)."""
+        with self._dirty_lock:
+            dirty, self._dirty = self._dirty, set()
+        if dirty:
+            lines = []
+            with self.lock:
+                for code in dirty:
+                    room = self.rooms.get(code)
+                    if room is None:
+                        lines.append(_dumps({"r": code, "x": 1}))
+                    else:
+                        lines.append(_dumps({"r": code, "v": room.get("version", 0), "d": room}))
+                        self.sizes[code] = len(lines[-1])
+            data = ("\n".join(lines) + "\n").encode("utf-8")
+            try:
+                with open(self.journal_path, "ab") as f:
+                    f.write(data)
+                    f.flush()
+                    os.fsync(f.fileno())
+            except OSError:
+                # lägg tillbaka så att nästa batch försöker igen
+                with self._dirty_lock:
+                    self._dirty |= dirty
+                raise
+            self._journal_records += len(lines)
+            self._journal_bytes += len(data)
+        if self._compact_due():
+            self.compact()
+
+    def compact(self):
+        """Skriver en komplett snapshot atomiskt och tömmer journalen."""
+        with self.lock:
+            data = _dumps(self.rooms)
+        tmp = self.state_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.state_path)
+        _fsync_dir(self.state_path)
+        self._snapshot_bytes = len(data.encode("utf-8"))
+        with open(self.journal_path, "w", encoding="utf-8") as f:
+            f.flush()
+            os.fsync(f.fileno())
+        self._journal_records = 0
+        self._journal_bytes = 0
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                now = time.time()
+                if now - self._last_evict >= EVICT_INTERVAL:
+                    self._last_evict = now
+                    self.evict(now)
+                    if self.spill_dir and now - self._last_spill_gc >= 3600:
+                        self._last_spill_gc = now
+                        self._gc_spill(now)
+                self.flush()
+            except Exception:
+                # nästa batch försöker igen; loggas direkt och sedan högst en gång per minut
+                now = time.time()
+                if self._failing_since is None:
+                    self._failing_since = now
+                if now - self._last_error_log >= ERROR_LOG_INTERVAL:
+                    self._last_error_log = now
+                    log.exception("Kunde inte spara rummen till %s (fel sedan %.0f s)",
+                                  self.journal_path, now - self._failing_since)
+            else:
+                if self._failing_since is not None:
+                    log.warning("Sparningen till %s fungerar igen efter %.0f s",
+                                self.journal_path, time.time() - self._failing_since)
+                    self._failing_since = None
+                    self._last_error_log = 0.0
+
+    def close(self):
+        self._stop.set()
+        try:
+            self.flush()
+        except Exception:
+            log.exception("Kunde inte spara rummen till %s vid avslut", self.journal_path)
@@ -0,0 +1,10 @@
+"""Egna Streamlit-komponenter (deklareras en gång per process)."""
+
+import os
+
+import streamlit.components.v1 as components
+
+COMPONENTS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "components")
+
+# Spelarkorten som en enda komponent, se components/card_grid/index.html
+card_grid = components.declare_component("card_grid", path=os.path.join(COMPONENTS_DIR, "card_grid"))
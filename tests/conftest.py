@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# paketet scrumpoker ligger i repots rot
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# lagret läser sökvägen vid import; appen i AppTest ska aldrig röra repots state-fil
+os.environ.setdefault("SCRUMPOKER_STATE_FILE", os.path.join(tempfile.mkdtemp(prefix="scrumpoker-test-"), "rooms_state.json"))
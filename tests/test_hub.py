@@ -0,0 +1,53 @@
+"""RoomHub: faller tillbaka på pollning när Streamlits interna anrop saknas."""
+
+import logging
+from types import SimpleNamespace
+
+import pytest
+
+from scrumpoker import hub as hub_mod
+from scrumpoker.hub import RoomHub
+
+
+class _Session:
+    def __init__(self):
+        self.reruns = 0
+
+    def request_rerun(self, _):
+        self.reruns += 1
+
+
+@pytest.fixture
+def fake_runtime(monkeypatch):
+    rt = SimpleNamespace()
+    monkeypatch.setattr(hub_mod.runtime, "exists", lambda: True)
+    monkeypatch.setattr(hub_mod.runtime, "get_instance", lambda: rt)
+    return rt
+
+
+def test_missing_hooks_fall_back_to_polling(fake_runtime, caplog):
+    hub = RoomHub()
+    hub.subscribe("ABC", "s1")
+    with caplog.at_level(logging.WARNING, logger="scrumpoker.hub"):
+        assert not hub.available
+        assert not hub.available
+        hub.publish("ABC")
+    assert len(caplog.records) == 1  # loggas en gång, inte per anrop
+    assert hub._subs == {"ABC": {"s1"}}  # prenumeranter behålls
+
+
+def test_publish_wakes_subscribers(fake_runtime):
+    sessions = {"s1": _Session(), "s2": _Session()}
+    fake_runtime._session_mgr = SimpleNamespace(
+        get_active_session_info=lambda sid: SimpleNamespace(session=sessions[sid]) if sid in sessions else None
+    )
+    loop = SimpleNamespace(call_soon_threadsafe=lambda fn, arg: fn(arg))
+    fake_runtime._get_async_objs = lambda: SimpleNamespace(eventloop=loop)
+    hub = RoomHub()
+    assert hub.available
+    for sid in ("s1", "s2", "gone"):
+        hub.subscribe("ABC", sid)
+    hub.publish("ABC", origin="s2")
+    hub.publish("ABC", origin="s2")  # s1 har redan en väntande omkörning
+    assert sessions["s1"].reruns == 1 and sessions["s2"].reruns == 0
+    assert hub._subs["ABC"] == {"s1", "s2"}  # borttagna sessioner avregistreras
@@ -0,0 +1,31 @@
+"""Backlog-import: batchar och fel i filen."""
+
+import io
+
+import pytest
+
+from scrumpoker.importer import backlog_batches, iter_backlog
+
+
+def _csv(rows, encoding="utf-8"):
+    lines = ["id,title"] + [f"K-{i},Story {i}" for i in range(rows)]
+    return io.BytesIO("\n".join(lines).encode(encoding))
+
+
+def test_batches_are_bounded():
+    stats = {}
+    batches = list(backlog_batches(iter_backlog(_csv(1203), "b.csv", stats), size=500))
+    assert [len(b) for b in batches] == [500, 500, 203]
+    assert stats == {"rows": 1203, "skipped": 0}
+
+
+def test_non_utf8_file_raises_with_row_count():
+    data = _csv(5000).getvalue() + "\nK-x,Räksmörgås".encode("cp1252")
+    stats = {}
+    imported = []
+    with pytest.raises(UnicodeDecodeError):
+        for batch in backlog_batches(iter_backlog(io.BytesIO(data), "excel.csv", stats), size=500):
+            imported.extend(batch)
+    # hela batchar före felet har hunnit läsas; raden med felet räknas inte
+    assert len(imported) % 500 == 0
+    assert stats["rows"] >= len(imported)
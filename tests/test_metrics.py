@@ -0,0 +1,23 @@
+"""Metrics: antalet rumsetiketter är begränsat."""
+
+from scrumpoker.metrics import OTHER_ROOM, Metrics
+
+
+def _enabled(max_rooms):
+    m = Metrics(max_rooms=max_rooms)
+    m.enabled = True  # utan fil och skrivtråd
+    return m
+
+
+def test_room_labels_are_capped_and_totals_kept():
+    m = _enabled(max_rooms=10)
+    for i in range(1000):
+        m.inc("mutations", f"R{i}")
+        m.inc("fragment_chat_hits", f"R{i}", 3)
+    assert len({code for _, code in m.counters}) <= 2 * 10 + 1
+    text = m.render()
+    rooms = {code for _, code in m.counters}
+    assert len(rooms) == 10 + 1 and OTHER_ROOM in rooms and "R999" in rooms
+    assert sum(v for (name, _), v in m.counters.items() if name == "mutations") == 1000
+    assert sum(v for (name, _), v in m.counters.items() if name == "fragment_chat_hits") == 3000
+    assert f'scrumpoker_mutations_total{{room="{OTHER_ROOM}"}} 990' in text
@@ -0,0 +1,70 @@
+"""SqliteRoomStore: två lager på samma databas, som två processer."""
+
+import os
+
+import pytest
+
+from scrumpoker.migrations import prepare_room
+from scrumpoker.rooms import _apply_mutation, new_room
+from scrumpoker.sqlite_store import SqliteRoomStore
+from scrumpoker.writer import RoomWriter
+
+
+@pytest.fixture
+def pair(tmp_path):
+    path = os.path.join(tmp_path, "rooms.db")
+    a = SqliteRoomStore(path, prepare=prepare_room, poll_interval=3600)
+    b = SqliteRoomStore(path, prepare=prepare_room, poll_interval=3600)
+    yield a, b
+    a.close()
+    b.close()
+
+
+def _set_text(text):
+    def fn(room):
+        room["stories"].first()["text"] = text
+        room["version"] = room.get("version", 0) + 1
+    return fn
+
+
+def test_mark_dirty_does_not_overwrite_newer_version(pair):
+    a, b = pair
+    a.mutate("ABC", _set_text("ett"), new_room)
+    assert b.get("ABC")["stories"].first()["text"] == "ett"
+    a.mutate("ABC", _set_text("två"), new_room)
+    # b har kvar den gamla versionen i cachen (ingen pollning) och skriver den
+    b.mark_dirty("ABC")
+    assert b.get("ABC")["stories"].first()["text"] == "två"
+    c = SqliteRoomStore(a.path, prepare=prepare_room, poll_interval=3600)
+    try:
+        assert c.get("ABC")["stories"].first()["text"] == "två"
+    finally:
+        c.close()
+
+
+def test_all_rooms_includes_rooms_outside_the_cache(pair):
+    a, b = pair
+    for code in ("ABC", "DEF"):
+        a.mutate(code, _set_text(code), new_room)
+    b.evict(now=10**12)  # töm cachen
+    assert b.rooms == {}
+    rooms = b.all_rooms()
+    assert {c: r["stories"].first()["text"] for c, r in rooms.items()} == {"ABC": "ABC", "DEF": "DEF"}
+    assert b.rooms == {}  # all_rooms fyller inte cachen
+
+
+def test_failed_command_is_visible_to_other_processes(pair):
+    a, b = pair
+    writer = RoomWriter(a, _apply_mutation, new_room)
+    writer.submit("ABC", lambda r: r)
+    b.get("ABC")
+
+    def fail(r):
+        r["stories"].first()["text"] = "halvvägs"
+        raise ValueError("trasig rad")
+
+    with pytest.raises(ValueError):
+        writer.submit("ABC", fail)
+    # b:s cache är inaktuell; den nya versionen gör att pollningen läser om rummet
+    assert b.poll() == ["ABC"]
+    assert b.get("ABC")["stories"].first()["text"] == "halvvägs"
@@ -0,0 +1,126 @@
+"""RoomStore: journal, snapshot och felhantering i skrivtråden."""
+
+import logging
+import os
+
+import pytest
+
+from scrumpoker.migrations import prepare_room
+from scrumpoker.rooms import new_room
+from scrumpoker.store import RoomStore, read_state
+
+
+@pytest.fixture
+def paths(tmp_path):
+    return os.path.join(tmp_path, "rooms_state.json"), os.path.join(tmp_path, "journal.jsonl")
+
+
+def _store(paths, **kw):
+    kw.setdefault("flush_interval", 3600)  # tester flushar själva
+    kw.setdefault("spill_dir", None)
+    return RoomStore(*paths, prepare=prepare_room, **kw)
+
+
+def _grow(room, n):
+    for _ in range(n):
+        room["stories"].append({"id": f"s{len(room['stories'])}", "text": "x" * 200})
+
+
+def test_large_rooms_compact_on_journal_size(paths):
+    # få poster men stora rum: antalet poster räcker inte som utlösare
+    s = _store(paths, compact_every=10**9, compact_min_bytes=64 * 1024, compact_ratio=2)
+    try:
+        largest = 0
+        for _ in range(200):
+            s.mutate("ABC", lambda r: _grow(r, 5), new_room)
+            s.flush()
+            largest = max(largest, os.path.getsize(paths[1]))
+        snapshot = os.path.getsize(paths[0])
+        # journalen passerar gränsen med högst en post innan den töms
+        assert largest < 2 * snapshot + snapshot
+        rooms, _ = read_state(*paths)
+        assert len(rooms["ABC"]["stories"]) == 1001
+    finally:
+        s.close()
+
+
+def test_journal_size_survives_restart(paths):
+    s = _store(paths, compact_every=10**9)
+    s.mutate("ABC", lambda r: _grow(r, 3), new_room)
+    s.close()
+    s = _store(paths, compact_every=10**9)
+    try:
+        assert s._journal_bytes == os.path.getsize(paths[1]) > 0
+    finally:
+        s.close()
+
+
+def test_failed_flush_is_logged(paths, caplog, monkeypatch):
+    s = _store(paths, flush_interval=0.01)
+    try:
+        monkeypatch.setattr(s, "journal_path", os.path.join(os.path.dirname(paths[1]), "saknas", "j.jsonl"))
+        with caplog.at_level(logging.ERROR, logger="scrumpoker.store"):
+            s.mutate("ABC", lambda r: _grow(r, 1), new_room)
+            for _ in range(200):
+                if caplog.records:
+                    break
+                s._stop.wait(0.01)
+        assert any("Kunde inte spara" in r.getMessage() for r in caplog.records)
+    finally:
+        monkeypatch.undo()
+        s.close()
+
+
+def test_all_rooms_includes_spilled_rooms(paths, tmp_path):
+    s = _store(paths, spill_dir=os.path.join(tmp_path, "spill"))
+    try:
+        for code in ("ABC", "D/F"):
+            s.mutate(code, lambda r: _grow(r, 1), new_room)
+        s.evict(now=10**12)
+        assert s.rooms == {}
+        s.get("ABC")  # tillbaka i minnet; spill-filen finns kvar
+        rooms = s.all_rooms()
+        assert len(rooms) == 2 and "ABC" in rooms
+        assert list(s.rooms) == ["ABC"]
+    finally:
+        s.close()
+
+
+def _text(room):
+    return [s["text"] for s in room["stories"]]
+
+
+def test_mutate_never_replaces_an_evicted_room(paths, tmp_path, monkeypatch):
+    s = _store(paths, spill_dir=os.path.join(tmp_path, "spill"))
+    try:
+        s.mutate("ABC", lambda r: _grow(r, 2), new_room)
+        before = _text(s.get("ABC"))
+        get = s.get
+
+        def get_then_evict(code):
+            # skrivtrådens evict() hinner köra direkt efter uppslaget
+            room = get(code)
+            s.evict(now=10**12)
+            return room
+
+        monkeypatch.setattr(s, "get", get_then_evict)
+        s.evict(now=10**12)
+        s.mutate("ABC", lambda r: _grow(r, 1), lambda: pytest.fail("rummet skapades på nytt"))
+        monkeypatch.undo()
+        assert _text(s.get("ABC"))[:len(before)] == before
+    finally:
+        s.close()
+
+
+def test_evict_skips_rooms_used_after_selection(paths, tmp_path):
+    s = _store(paths, spill_dir=os.path.join(tmp_path, "spill"))
+    try:
+        s.mutate("ABC", lambda r: _grow(r, 1), new_room)
+        chosen_at = max(s.access["ABC"], s.get("ABC")["last_update"])
+        s.access["ABC"] = chosen_at + 1  # en session läste rummet efter valet
+        assert not s._evict_one("ABC", chosen_at)
+        assert "ABC" in s.rooms
+        assert s._evict_one("ABC", chosen_at + 1)
+        assert "ABC" not in s.rooms
+    finally:
+        s.close()
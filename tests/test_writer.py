@@ -0,0 +1,135 @@
+"""RoomWriter: skurar av ändringar från många trådar mot samma rum."""
+
+import logging
+import os
+import threading
+import time
+
+import pytest
+
+logging.disable(logging.WARNING)
+
+from scrumpoker.migrations import prepare_room  # noqa: E402
+from scrumpoker.model import record_vote  # noqa: E402
+from scrumpoker.rooms import _apply_mutation, new_room  # noqa: E402
+from scrumpoker.store import RoomStore  # noqa: E402
+from scrumpoker.writer import RoomWriter  # noqa: E402
+
+THREADS = 30
+PER_THREAD = 20
+
+
+@pytest.fixture
+def store(tmp_path):
+    s = RoomStore(os.path.join(tmp_path, "rooms_state.json"), os.path.join(tmp_path, "journal.jsonl"),
+                  prepare=prepare_room, spill_dir=None)
+    yield s
+    s.close()
+
+
+@pytest.fixture
+def writer(store):
+    commits = []
+    w = RoomWriter(store, _apply_mutation, new_room, on_commit=lambda code, n: commits.append(n))
+    w.commits = commits
+    return w
+
+
+def _burst(threads, work):
+    """Släpper alla trådar samtidigt och kör work(t) i var och en."""
+    start = threading.Barrier(threads)
+    errors = []
+
+    def run(t):
+        start.wait()
+        try:
+            work(t)
+        except Exception as e:  # samlas och kontrolleras av testet
+            errors.append(e)
+
+    pool = [threading.Thread(target=run, args=(t,)) for t in range(threads)]
+    for th in pool:
+        th.start()
+    for th in pool:
+        th.join()
+    return errors
+
+
+def test_vote_burst_loses_nothing(writer, store):
+    writer.submit("R", lambda r: r)
+    sid = store.get("R")["active_story_id"]
+    version0 = store.get("R")["version"]
+    versions = []
+
+    def work(t):
+        for i in range(PER_THREAD):
+            versions.append(writer.submit("R", lambda r, p=f"p{t}-{i}": record_vote(r, sid, p, 3.0)))
+
+    assert _burst(THREADS, work) == []
+    room = store.get("R")
+    expected = THREADS * PER_THREAD
+    assert len(room["votes"][sid]) == expected
+    assert room["agg"][sid].n == expected
+    assert room["version"] - version0 == expected
+    assert sorted(versions) == list(range(version0 + 1, version0 + expected + 1))
+    assert sum(writer.commits[1:]) == expected
+
+
+def test_each_command_runs_exactly_once(writer):
+    calls = {}
+    lock = threading.Lock()
+
+    def work(t):
+        for i in range(PER_THREAD):
+            def fn(r, key=(t, i)):
+                with lock:
+                    calls[key] = calls.get(key, 0) + 1
+                time.sleep(0.0005)  # låt kön växa så att kommandon slås ihop
+            writer.submit("R", fn)
+
+    assert _burst(THREADS, work) == []
+    assert len(calls) == THREADS * PER_THREAD
+    assert set(calls.values()) == {1}
+    assert max(writer.commits) > 1  # andra trådars kommandon kördes i samma commit
+
+
+def test_error_stays_with_its_caller(writer, store):
+    writer.submit("R", lambda r: r)
+    sid = store.get("R")["active_story_id"]
+
+    def work(t):
+        time.sleep(0.0005 * (t % 3))
+        if t % 5 == 0:
+            writer.submit("R", lambda r: 1 / 0)
+        else:
+            writer.submit("R", lambda r, p=f"p{t}": (record_vote(r, sid, p, 1.0), time.sleep(0.001)))
+
+    errors = _burst(THREADS, work)
+    assert len(errors) == THREADS // 5
+    assert all(isinstance(e, ZeroDivisionError) for e in errors)
+    assert len(store.get("R")["votes"][sid]) == THREADS - THREADS // 5
+
+
+def test_idle_queues_are_pruned(writer):
+    for i in range(50):
+        writer.submit(f"ROOM{i}", lambda r: r)
+    assert writer._queues == {}
+
+
+def test_failing_command_still_bumps_version(writer, store):
+    writer.submit("R", lambda r: r)
+    version0 = store.get("R")["version"]
+    stories0 = len(store.get("R")["stories"])
+
+    def half_import(r):
+        for i in range(3):
+            r["stories"].append({"id": f"imp{i}", "text": "x"})
+        raise UnicodeDecodeError("utf-8", b"\xe5", 0, 1, "invalid start byte")
+
+    with pytest.raises(UnicodeDecodeError):
+        writer.submit("R", half_import)
+    room = store.get("R")
+    # det som hann ändras sparas, men under en ny version så att cachar byggs om
+    assert len(room["stories"]) == stories0 + 3
+    assert room["version"] == version0 + 1
+    assert writer.submit("R", lambda r: r) == version0 + 2